@@ -0,0 +1,373 @@
+"""Benchmark do processamento de Lead Time com exportações sintéticas de notas fiscais.
+
+Gera CSVs com as colunas obrigatórias (e algumas extras, como na exportação real), roda a carga e as
+agregações fora do Streamlit e mostra tempo, vazão e pico de memória por etapa. Exemplos:
+
+    python benchmark.py --linhas 10k,100k,1M
+    python benchmark.py --linhas 1M --salvar-base benchmark_base.json
+    python benchmark.py --linhas 1M --comparar benchmark_base.json --referencia
+    python benchmark.py --linhas 10M --trabalhadores 4,8,16 --sem-memoria
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import processamento_leadtime as lt
+
+# Proporção padrão de cada marca nos dados gerados (marcas fora de MARCAS_PRINCIPAIS são filtradas na carga)
+MIX_MARCAS_PADRAO = {
+    'PAPAIZ': 0.35,
+    'LA FONTE': 0.25,
+    'SILVANA CD SP': 0.15,
+    'YALE': 0.15,
+    'VAULT': 0.10
+}
+CANAIS_SINTETICOS = ['WEBSHOP B2C', 'HOME CENTER SP', 'Webshop Pro', 'DISTRIBUIDOR', 'VAREJO', 'HOME CENTER RJ']
+CIDADES_SINTETICAS = ['SAO PAULO', 'RIO DE JANEIRO', 'BELO HORIZONTE', 'CURITIBA', 'PORTO ALEGRE', 'RECIFE']
+
+# Variação de tempo acima da qual uma etapa é marcada como regressão na comparação com a base
+TOLERANCIA_REGRESSAO = 0.20
+
+# Linhas usadas na conferência com as implementações linha a linha (lentas) da versão original
+LINHAS_REFERENCIA = 200_000
+
+def ler_quantidade(texto):
+    """Converte '10k', '1M' ou '250000' em número de linhas"""
+    texto = texto.strip().lower().replace('_', '')
+    multiplicadores = {'k': 1_000, 'm': 1_000_000}
+    if texto[-1] in multiplicadores:
+        return int(float(texto[:-1]) * multiplicadores[texto[-1]])
+    return int(texto)
+
+def ler_mix_marcas(texto):
+    """Converte 'PAPAIZ=0.5,YALE=0.5' no dicionário de proporções por marca"""
+    mix = {}
+    for item in texto.split(','):
+        marca, proporcao = item.rsplit('=', 1)
+        mix[marca.strip()] = float(proporcao)
+    return mix
+
+def ler_trabalhadores(texto):
+    """Lista de números de processos, ex.: '4,8,16'"""
+    try:
+        quantidades = [int(parte) for parte in texto.split(',') if parte.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Número de processos inválido: '{texto}'")
+    if any(quantidade < 2 for quantidade in quantidades):
+        raise argparse.ArgumentTypeError("A carga paralela usa pelo menos 2 processos")
+    return quantidades
+
+def gerar_dados_sinteticos(linhas, proporcao_duplicados=0.1, proporcao_datas_invalidas=0.01,
+                           mix_marcas=None, colunas_extras=10, semente=0):
+    """DataFrame no formato da exportação de notas fiscais, com datas DD/MM/AAAA"""
+    rng = np.random.default_rng(semente)
+    mix_marcas = mix_marcas or MIX_MARCAS_PADRAO
+    marcas = list(mix_marcas)
+    pesos = np.array(list(mix_marcas.values()), dtype=float)
+    
+    # Notas únicas embaralhadas com as repetidas sorteadas entre elas
+    unicas = max(1, int(round(linhas * (1 - proporcao_duplicados))))
+    notas = np.concatenate([
+        rng.permutation(unicas) + 100_000,
+        rng.integers(0, unicas, linhas - unicas) + 100_000
+    ])
+    rng.shuffle(notas)
+    
+    emissao = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 730, linhas), unit='D')
+    embarque = emissao - pd.to_timedelta(rng.geometric(0.25, linhas) - 1, unit='D')
+    datas_emissao = pd.Series(emissao.strftime('%d/%m/%Y'), dtype=object)
+    datas_embarque = pd.Series(embarque.strftime('%d/%m/%Y'), dtype=object)
+    datas_emissao[rng.random(linhas) < proporcao_datas_invalidas] = '00/00/0000'
+    datas_embarque[rng.random(linhas) < 0.02] = None
+    
+    df = pd.DataFrame({
+        'desc_marca': np.array(marcas, dtype=object)[rng.choice(len(marcas), linhas, p=pesos / pesos.sum())],
+        'desc_canal_venda': np.array(CANAIS_SINTETICOS, dtype=object)[rng.integers(0, len(CANAIS_SINTETICOS), linhas)],
+        'dat_embarque': datas_embarque,
+        'dat_emissao_nf': datas_emissao,
+        'nom_cidade': np.array(CIDADES_SINTETICAS, dtype=object)[rng.integers(0, len(CIDADES_SINTETICAS), linhas)],
+        'num_nota_fiscal': notas
+    })
+    for indice in range(colunas_extras):
+        df[f'extra_{indice}'] = rng.integers(0, 1_000_000, linhas)
+    return df
+
+def caminho_dados_sinteticos(pasta, linhas, argumentos):
+    """Gera o CSV sintético (ou reaproveita um já gerado com os mesmos parâmetros) e retorna o caminho"""
+    nome = (
+        f"nf_{linhas}_dup{argumentos.duplicados}_inv{argumentos.datas_invalidas}"
+        f"_mix{hashlib.sha256(json.dumps(argumentos.mix_marcas, sort_keys=True).encode()).hexdigest()[:8]}"
+        f"_s{argumentos.semente}.csv"
+    )
+    caminho = os.path.join(pasta, nome)
+    if not os.path.exists(caminho):
+        df = gerar_dados_sinteticos(
+            linhas,
+            argumentos.duplicados,
+            argumentos.datas_invalidas,
+            argumentos.mix_marcas,
+            semente=argumentos.semente
+        )
+        df.to_csv(caminho + '.tmp', index=False, encoding='utf-8-sig')
+        os.replace(caminho + '.tmp', caminho)
+    return caminho
+
+def medir_cenario(nome, funcao, medir_memoria):
+    """Roda `funcao()` como etapa `nome` com um perfil próprio (as subetapas do pipeline ficam dentro dela)"""
+    perfil = lt.PerfilEtapas(medir_memoria=medir_memoria)
+    token = lt.PERFIL_ATIVO.set(perfil)
+    try:
+        with perfil.medir(nome):
+            resultado = funcao()
+    finally:
+        lt.PERFIL_ATIVO.reset(token)
+        perfil.encerrar()
+    return perfil, resultado
+
+def carregar_arquivo(caminho, carregar):
+    """Carrega o CSV com a função de carga do dashboard e monta os DadosProcessados (com o cubo)"""
+    with open(caminho, 'rb') as arquivo:
+        df, mensagem = carregar(arquivo)
+    if df.empty:
+        raise RuntimeError(mensagem)
+    return lt.DadosProcessados(df, mensagem, lt.IndiceNotasFiscais())
+
+def consultar(dados):
+    """Consultas feitas pelo dashboard com todos os filtros selecionados"""
+    inicio, fim = dados.cubo.periodo
+    marcas, canais = dados.cubo.marcas, dados.cubo.canais
+    cubo = dados.cubo.filtrar(inicio, fim, marcas, canais)
+    cubo.estatisticas('Marca')
+    cubo.quantis([0.5] + list(lt.PERCENTIS_TABELA.values()), 'Marca')
+    cubo.estatisticas_periodo(lt.escolher_granularidade(inicio, fim)[2], ['Marca'])
+    cubo.estatisticas_boxplot('Marca')
+    dados.filtrar(inicio, fim, marcas, canais)
+
+def nome_carga_paralela(trabalhadores):
+    """Nome do cenário de carga paralela com `trabalhadores` processos"""
+    return f"Carga paralela ({trabalhadores} processos)"
+
+def aquecer_pool(trabalhadores):
+    """Inicia os processos do pool fora da medição (cada um importa o pandas ao iniciar)"""
+    list(lt.obter_pool(trabalhadores).map(time.sleep, [0.5] * trabalhadores))
+
+def executar_cenarios(caminho, medir_memoria, trabalhadores=()):
+    """Carga completa, carga em blocos, carga em blocos com cada número de `trabalhadores` e consultas;
+    retorna a lista de (cenário, PerfilEtapas)"""
+    perfil_completa, dados = medir_cenario('Carga completa', lambda: carregar_arquivo(caminho, lt.carregar_dados), medir_memoria)
+    carga_blocos = lambda arquivo: lt.carregar_dados_em_blocos(arquivo, trabalhadores=1)
+    perfil_blocos, _ = medir_cenario('Carga em blocos', lambda: carregar_arquivo(caminho, carga_blocos), medir_memoria)
+    cenarios = [('Carga completa', perfil_completa), ('Carga em blocos', perfil_blocos)]
+    for quantidade in trabalhadores:
+        aquecer_pool(quantidade)
+        carga_paralela = lambda arquivo: lt.carregar_dados_em_blocos(arquivo, trabalhadores=quantidade)
+        nome = nome_carga_paralela(quantidade)
+        cenarios.append((nome, medir_cenario(nome, lambda: carregar_arquivo(caminho, carga_paralela), medir_memoria)[0]))
+    perfil_consultas, _ = medir_cenario('Consultas', lambda: consultar(dados), medir_memoria)
+    return cenarios + [('Consultas', perfil_consultas)]
+
+def medir(caminho, linhas, repeticoes=1, medir_memoria=True, trabalhadores=()):
+    """Resultados por cenário e etapa: menor tempo entre as repetições (sem o custo do tracemalloc) e,
+    numa rodada à parte, o pico de memória"""
+    rodadas = [executar_cenarios(caminho, medir_memoria=False, trabalhadores=trabalhadores) for _ in range(repeticoes)]
+    memoria = dict(executar_cenarios(caminho, medir_memoria=True, trabalhadores=trabalhadores)) if medir_memoria else {}
+    resultados = []
+    for indice, (cenario, perfil) in enumerate(rodadas[0]):
+        for nome, registro in perfil.etapas.items():
+            segundos = min(rodada[indice][1].etapas[nome]['segundos'] for rodada in rodadas)
+            pico = memoria[cenario].etapas[nome]['memoria_pico'] / 1024 ** 2 if cenario in memoria else None
+            resultados.append({
+                'linhas': linhas,
+                'cenario': cenario,
+                'etapa': nome,
+                'nivel': registro['nivel'],
+                'segundos': segundos,
+                'linhas_por_segundo': linhas / segundos if segundos > 0 else None,
+                'pico_mb': pico
+            })
+    return resultados
+
+# Implementações linha a linha da versão original do dashboard, usadas como referência de resultado e de tempo
+# (o lead time usa o calendário de feriados da marca, como o pipeline, que a versão original não tinha)
+def agrupar_canal_referencia(canal):
+    if pd.isna(canal):
+        return 'DEMAIS CANAIS'
+    if 'WEBSHOP' in str(canal).upper():
+        return 'WEBSHOP'
+    elif 'HOME CENTER' in str(canal).upper():
+        return 'HOME CENTER'
+    else:
+        return 'DEMAIS CANAIS'
+
+def calcular_leadtime_excel_referencia(row):
+    data_emissao = row['Data_Emissao_NF']
+    data_embarque = row['Data_Embarque']
+    
+    if pd.isna(data_emissao) or pd.isna(data_embarque):
+        return 0
+    
+    if data_emissao.date() == data_embarque.date():
+        return 0
+    
+    calendario = lt.calendario_marca(row['Marca'])
+    dia_semana_emissao = data_emissao.weekday()
+    dec = 0 if dia_semana_emissao in calendario.emissao_sem_desconto else 1
+    
+    try:
+        dias_uteis = np.busday_count(data_embarque.date(), data_emissao.date(), busdaycal=calendario.calendario)
+        leadtime = dias_uteis - dec
+        return max(0, leadtime)
+    except:
+        return 0
+
+def comparar_com_referencia(caminho, linhas_maximas=LINHAS_REFERENCIA):
+    """Confere canal agrupado e lead time do pipeline com as versões linha a linha; retorna as linhas do relatório"""
+    with open(caminho, 'rb') as arquivo:
+        df, mensagem = lt.carregar_dados(arquivo)
+    if df.empty:
+        raise RuntimeError(mensagem)
+    amostra = df.head(linhas_maximas)
+    
+    inicio = time.perf_counter()
+    canais = amostra['Canal_Venda'].astype(object).apply(agrupar_canal_referencia)
+    leadtime = amostra.apply(calcular_leadtime_excel_referencia, axis=1)
+    tempo_referencia = time.perf_counter() - inicio
+    
+    inicio = time.perf_counter()
+    canais_vetorizado = lt.agrupar_canais(amostra['Canal_Venda'])
+    leadtime_vetorizado = lt.calcular_leadtime_por_marca(amostra['Marca'], amostra['Data_Embarque'], amostra['Data_Emissao_NF'])
+    tempo_vetorizado = time.perf_counter() - inicio
+    
+    divergencias_canal = int((canais.to_numpy() != np.asarray(canais_vetorizado, dtype=object)).sum())
+    divergencias_leadtime = int((leadtime.to_numpy() != leadtime_vetorizado).sum())
+    return [
+        f"Referência linha a linha ({len(amostra):,} linhas): {tempo_referencia:.2f} s; "
+        f"vetorizado: {tempo_vetorizado * 1000:.1f} ms ({tempo_referencia / tempo_vetorizado:,.0f}x)",
+        f"Divergências: canal agrupado {divergencias_canal}, lead time {divergencias_leadtime}"
+    ], divergencias_canal + divergencias_leadtime
+
+def comparar_com_base(resultados, base, tolerancia=TOLERANCIA_REGRESSAO):
+    """Acrescenta o tempo da base e a variação a cada resultado; retorna as etapas com regressão"""
+    tempos_base = {(item['linhas'], item['cenario'], item['etapa']): item['segundos'] for item in base['resultados']}
+    regressoes = []
+    for item in resultados:
+        segundos_base = tempos_base.get((item['linhas'], item['cenario'], item['etapa']))
+        item['segundos_base'] = segundos_base
+        item['variacao'] = item['segundos'] / segundos_base - 1 if segundos_base else None
+        if item['variacao'] is not None and item['variacao'] > tolerancia and item['nivel'] == 0:
+            regressoes.append(item)
+    return regressoes
+
+def formatar_escalabilidade(resultados, trabalhadores):
+    """Aceleração da carga paralela em relação à carga em blocos num só processo, por tamanho"""
+    tempos = {(item['linhas'], item['cenario']): item['segundos'] for item in resultados if item['nivel'] == 0}
+    linhas = []
+    for quantidade in trabalhadores:
+        for (tamanho, cenario), segundos in tempos.items():
+            if cenario == nome_carga_paralela(quantidade):
+                aceleracao = tempos[(tamanho, 'Carga em blocos')] / segundos
+                linhas.append({
+                    'Linhas': f"{tamanho:,}",
+                    'Processos': quantidade,
+                    'Tempo (s)': f"{segundos:.3f}",
+                    'Aceleração': f"{aceleracao:.2f}x",
+                    'Eficiência': f"{aceleracao / quantidade:.0%}"
+                })
+    return pd.DataFrame(linhas).to_string(index=False)
+
+def formatar_resultados(resultados):
+    """Tabela de texto com uma linha por tamanho e etapa"""
+    tabela = pd.DataFrame([{
+        'Linhas': f"{item['linhas']:,}",
+        'Etapa': '  ' * item['nivel'] + item['etapa'],
+        'Tempo (s)': f"{item['segundos']:.3f}",
+        'Linhas/s': f"{item['linhas_por_segundo']:,.0f}" if item['linhas_por_segundo'] else '-',
+        'Pico (MB)': f"{item['pico_mb']:.1f}" if item['pico_mb'] is not None else '-',
+        **({
+            'Base (s)': f"{item['segundos_base']:.3f}" if item['segundos_base'] else '-',
+            'Variação': f"{item['variacao']:+.0%}" if item['variacao'] is not None else '-'
+        } if 'segundos_base' in item else {})
+    } for item in resultados])
+    return tabela.to_string(index=False)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do processamento de Lead Time com dados sintéticos")
+    parser.add_argument('--linhas', default='10k,100k,1M',
+                        help="Tamanhos separados por vírgula (ex.: 10k,100k,1M,10M)")
+    parser.add_argument('--duplicados', type=float, default=0.1, help="Proporção de notas fiscais repetidas")
+    parser.add_argument('--datas-invalidas', type=float, default=0.01, help="Proporção de datas de emissão inválidas")
+    parser.add_argument('--mix-marcas', type=ler_mix_marcas, default=MIX_MARCAS_PADRAO,
+                        help="Proporção de cada marca, ex.: 'PAPAIZ=0.5,LA FONTE=0.3,YALE=0.2'")
+    parser.add_argument('--semente', type=int, default=0, help="Semente dos dados sintéticos")
+    parser.add_argument('--pasta', default=os.path.join(tempfile.gettempdir(), 'leadtime_benchmark'),
+                        help="Pasta onde os CSVs gerados ficam guardados entre execuções")
+    parser.add_argument('--repeticoes', type=int, default=1, help="Repetições por tamanho (vale o menor tempo)")
+    parser.add_argument('--sem-memoria', action='store_true', help="Não faz a rodada de medição de memória")
+    parser.add_argument('--referencia', action='store_true',
+                        help="Confere o resultado com as implementações linha a linha da versão original")
+    parser.add_argument('--salvar-base', metavar='ARQUIVO', help="Grava os resultados em JSON como base de comparação")
+    parser.add_argument('--comparar', metavar='ARQUIVO', help="Compara com uma base gravada por --salvar-base")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_REGRESSAO,
+                        help="Variação de tempo das etapas principais considerada regressão (0.2 = 20%%)")
+    parser.add_argument('--trabalhadores', type=ler_trabalhadores, default=[],
+                        help="Números de processos da carga paralela separados por vírgula (ex.: 4,8,16)")
+    argumentos = parser.parse_args(argv)
+    
+    os.makedirs(argumentos.pasta, exist_ok=True)
+    resultados = []
+    divergencias = 0
+    for linhas in (ler_quantidade(texto) for texto in argumentos.linhas.split(',')):
+        inicio = time.perf_counter()
+        caminho = caminho_dados_sinteticos(argumentos.pasta, linhas, argumentos)
+        print(f"{linhas:,} linhas: {os.path.getsize(caminho) / 1024 ** 2:,.1f} MB "
+              f"(preparado em {time.perf_counter() - inicio:.1f} s)", file=sys.stderr)
+        resultados.extend(medir(caminho, linhas, argumentos.repeticoes, medir_memoria=not argumentos.sem_memoria,
+                                trabalhadores=argumentos.trabalhadores))
+        if argumentos.referencia:
+            linhas_relatorio, divergencias_tamanho = comparar_com_referencia(caminho)
+            divergencias += divergencias_tamanho
+            for linha in linhas_relatorio:
+                print(f"{linhas:,} linhas - {linha}")
+    
+    regressoes = []
+    if argumentos.comparar:
+        with open(argumentos.comparar, encoding='utf-8') as arquivo:
+            regressoes = comparar_com_base(resultados, json.load(arquivo), argumentos.tolerancia)
+    print(formatar_resultados(resultados))
+    if argumentos.trabalhadores:
+        # A aceleração depende dos núcleos livres: mais processos que núcleos só somam custo
+        print(f"\nCarga paralela em {os.cpu_count()} núcleo(s):")
+        print(formatar_escalabilidade(resultados, argumentos.trabalhadores))
+    
+    if argumentos.salvar_base:
+        with open(argumentos.salvar_base, 'w', encoding='utf-8') as arquivo:
+            json.dump({
+                'ambiente': {
+                    'data': date.today().isoformat(),
+                    'python': platform.python_version(),
+                    'pandas': pd.__version__,
+                    'numpy': np.__version__,
+                    'processador': platform.processor() or platform.machine(),
+                    'nucleos': os.cpu_count()
+                },
+                'resultados': resultados
+            }, arquivo, ensure_ascii=False, indent=2)
+    
+    for item in regressoes:
+        print(f"⚠️ Regressão: {item['etapa']} com {item['linhas']:,} linhas "
+              f"{item['variacao']:+.0%} ({item['segundos_base']:.3f} s -> {item['segundos']:.3f} s)")
+    if divergencias:
+        print(f"❌ {divergencias} divergências em relação às implementações de referência")
+    return 1 if regressoes or divergencias else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,17 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime
 import warnings
 import io
+import os
+import time
+from processamento_leadtime import (
+    CacheLRU, RegistroDados, PerfilEtapas, PERFIL_ATIVO, PERFIL_PADRAO, PERCENTIS_TABELA, VERSAO_PIPELINE,
+    LIMITE_PROCESSAMENTO_BLOCOS, etapa, escolher_granularidade, calcular_hash_arquivo, combinar_chaves,
+    salvar_snapshot, ler_snapshot, opcoes_carga, motores_csv_disponiveis, processar_arquivo,
+    PASTA_ARTEFATO, ler_manifesto, ler_artefato, MARCAS_PRINCIPAIS, chave_marcas, sem_notas_novas
+)
+# O plotly.express é importado pelas funções que montam os gráficos: a abertura do app não paga esse custo
 warnings.filterwarnings('ignore')
 
 # Configuração da página
@@ -32,6 +38,41 @@ cores_canal = {
     "DEMAIS CANAIS": "#2ca02c"
 }
 
+# Memória máxima dos dados processados mantidos em memória, compartilhados entre as sessões
+# (dados em uso por alguma sessão não são descartados mesmo acima do limite)
+MEMORIA_MAX_DADOS = int(os.environ.get('LEADTIME_MEMORIA_DADOS_MB', '1024')) * 1024 ** 2
+
+# Quantidade máxima de figuras montadas mantidas em memória (por gráfico e combinação de filtros)
+MAX_FIGURAS_CACHE = 64
+
+# Modos de carga de um novo arquivo em relação aos dados já carregados na sessão
+MODO_SUBSTITUIR = "Substituir dados atuais"
+MODO_ACRESCENTAR = "Acrescentar aos dados atuais"
+
+@st.cache_resource
+def obter_cache_processamento():
+    """Registro de dados processados compartilhado entre as sessões e execuções do script"""
+    return RegistroDados(MEMORIA_MAX_DADOS)
+
+@st.cache_resource
+def obter_cache_figuras():
+    """Cache de figuras Plotly já montadas, compartilhado entre as execuções do script"""
+    return CacheLRU(MAX_FIGURAS_CACHE)
+
+def obter_figura(nome, chave_filtros, criar, tempos):
+    """Figura do cache ou montada por `criar()`; registra em `tempos[nome]` o tempo gasto e se veio do cache"""
+    inicio = time.perf_counter()
+    cache = obter_cache_figuras()
+    chave = (nome,) + chave_filtros
+    figura = cache.obter(chave)
+    em_cache = figura is not None
+    if not em_cache:
+        with etapa(f'Gráfico {nome}'):
+            figura = criar()
+        cache.guardar(chave, figura)
+    tempos[nome] = (time.perf_counter() - inicio, em_cache)
+    return figura
+
 def interface_upload():
     """Interface para upload do arquivo CSV"""
     st.title('📊 Dashboard Lead Time por Marca')
@@ -40,8 +81,19 @@ def interface_upload():
     st.markdown("### 📁 Upload do Arquivo de Dados")
     
     col1, col2 = st.columns([2, 1])
+    detalhes_arquivo = None
     
     with col1:
+        if st.session_state.get('arquivos_conjunto'):
+            st.radio(
+                "Modo de carga do próximo arquivo",
+                options=[MODO_SUBSTITUIR, MODO_ACRESCENTAR],
+                key='modo_carga',
+                horizontal=True,
+                help="Escolha antes de selecionar o arquivo. 'Acrescentar' processa só o arquivo novo "
+                     "(ex.: as notas do dia) e junta aos dados já carregados, ignorando notas fiscais repetidas."
+            )
+        
         uploaded_file = st.file_uploader(
             "Selecione o arquivo CSV com os dados de Lead Time",
             type=['csv'],
@@ -49,8 +101,6 @@ def interface_upload():
         )
         
         if uploaded_file is not None:
-            # Salvar o arquivo na sessão
-            st.session_state.uploaded_file = uploaded_file
             st.success(f"✅ Arquivo '{uploaded_file.name}' carregado com sucesso!")
             
             # Mostrar informações do arquivo
@@ -60,9 +110,28 @@ def interface_upload():
                 "Tipo": uploaded_file.type
             }
             
-            with st.expander("ℹ️ Detalhes do Arquivo"):
+            detalhes_arquivo = st.expander("ℹ️ Detalhes do Arquivo")
+            with detalhes_arquivo:
                 for key, value in file_details.items():
                     st.write(f"**{key}:** {value}")
+            
+            st.checkbox(
+                "Processar em blocos (arquivos grandes)",
+                value=uploaded_file.size > LIMITE_PROCESSAMENTO_BLOCOS,
+                key='processar_em_blocos',
+                help="Lê o CSV em partes e mantém em memória só as colunas necessárias, limitando o uso de memória."
+            )
+            
+            motores = motores_csv_disponiveis()
+            if len(motores) > 1:
+                st.selectbox(
+                    "Leitor de CSV",
+                    options=motores,
+                    key='motor_csv',
+                    disabled=st.session_state.get('processar_em_blocos', False),
+                    help="'pyarrow' lê o arquivo com várias threads e costuma ser mais rápido em máquinas "
+                         "com vários núcleos. O processamento em blocos usa sempre o leitor 'c'."
+                )
     
     with col2:
         st.markdown("#### 📋 Formato Esperado")
@@ -76,176 +145,263 @@ def interface_upload():
         - `num_nota_fiscal`
         """)
         
-        st.markdown("#### 📊 Marcas Suportadas")
-        st.markdown("""
-        - PAPAIZ
-        - LA FONTE
-        - SILVANA CD SP
-        """)
+        st.markdown("#### 📊 Marcas Analisadas")
+        # Registros de marcas fora da seleção são descartados na leitura, antes do cálculo do lead time
+        marcas_conhecidas = MARCAS_PRINCIPAIS + [marca for marca in cores_marca if marca not in MARCAS_PRINCIPAIS + ['Total']]
+        st.multiselect(
+            "Marcas processadas no upload",
+            options=marcas_conhecidas,
+            default=MARCAS_PRINCIPAIS,
+            key='marcas_analisadas',
+            help="Escolha antes de selecionar o arquivo. Mudar a seleção processa o arquivo de novo; "
+                 "menos marcas deixam a carga mais rápida."
+        )
     
-    return uploaded_file
+    return uploaded_file, detalhes_arquivo
 
-def carregar_dados(uploaded_file=None):
-    """Carrega e processa os dados do CSV"""
-    try:
-        # Tentar carregar de arquivo carregado primeiro
-        if uploaded_file is not None:
-            # Reset do ponteiro do arquivo
-            uploaded_file.seek(0)
-            df = pd.read_csv(uploaded_file, encoding='utf-8-sig')
-            data_source = f"arquivo carregado '{uploaded_file.name}'"
+def chave_processamento(uploaded_file=None, em_blocos=False, marcas=MARCAS_PRINCIPAIS):
+    """Chave do cache: hash do conteúdo do arquivo + versão do pipeline + modo de leitura + marcas analisadas"""
+    modo = f"{'blocos' if em_blocos else 'completo'}:{chave_marcas(marcas)}"
+    if uploaded_file is None:
+        try:
+            with open('leaditme_base.csv', 'rb') as arquivo_local:
+                return f"{calcular_hash_arquivo(arquivo_local)}:{VERSAO_PIPELINE}:{modo}"
+        except FileNotFoundError:
+            return None
+    
+    # O hash do upload é calculado uma vez por arquivo e guardado na sessão
+    identificacao = (uploaded_file.name, uploaded_file.size, getattr(uploaded_file, 'file_id', None))
+    hash_sessao = st.session_state.get('hash_arquivo')
+    if hash_sessao is None or hash_sessao[0] != identificacao:
+        hash_sessao = (identificacao, calcular_hash_arquivo(uploaded_file))
+        st.session_state.hash_arquivo = hash_sessao
+    return f"{hash_sessao[1]}:{VERSAO_PIPELINE}:{modo}"
+
+def obter_dados_cache(chave):
+    """Busca dados processados na memória e, após um restart, no snapshot em disco"""
+    cache = obter_cache_processamento()
+    dados = cache.obter(chave)
+    if dados is None:
+        with etapa('Leitura do snapshot'):
+            dados = ler_snapshot(chave)
+        if dados is not None:
+            cache.guardar(chave, dados)
+    return dados
+
+def guardar_dados_cache(chave, dados):
+    """Guarda dados processados na memória e em snapshot"""
+    with etapa('Gravação do snapshot'):
+        salvar_snapshot(chave, dados)
+    obter_cache_processamento().guardar(chave, dados)
+
+def carregar_artefato_com_cache(pasta):
+    """Dados pré-processados pelo processar_lote.py, lidos uma vez por geração; retorna (dados, mensagem),
+    com (None, None) quando a pasta não tem dados pré-processados"""
+    manifesto = ler_manifesto(pasta)
+    if manifesto is None:
+        return None, None
+    
+    # Cada execução do lote grava um novo manifesto: a data de geração entra na chave
+    chave = f"artefato:{os.path.abspath(pasta)}:{manifesto['gerado_em']}"
+    cache = obter_cache_processamento()
+    dados = cache.obter(chave)
+    if dados is None:
+        dados, mensagem = ler_artefato(pasta)
+        if dados is None:
+            return None, mensagem
+        cache.guardar(chave, dados)
+    return dados, dados.mensagem
+
+def carregar_dados_com_cache(uploaded_file=None, em_blocos=False, motor_csv='c', marcas=MARCAS_PRINCIPAIS):
+    """Carrega os dados reaproveitando o processamento já feito para o mesmo conteúdo; retorna (dados, mensagem)"""
+    chave = chave_processamento(uploaded_file, em_blocos, marcas)
+    if chave is not None:
+        dados = obter_dados_cache(chave)
+        if dados is not None:
+            return dados, dados.mensagem
+    
+    dados, mensagem = processar_arquivo(uploaded_file, em_blocos, motor_csv, marcas=marcas)
+    # Erros não são guardados para que um novo upload seja processado de novo
+    if dados is None:
+        return None, mensagem
+    
+    if chave is not None:
+        guardar_dados_cache(chave, dados)
+    return dados, mensagem
+
+def carregar_dados_sessao(uploaded_file=None, em_blocos=False, motor_csv='c', marcas=MARCAS_PRINCIPAIS):
+    """Carrega o arquivo sozinho ou acrescentado aos arquivos já carregados na sessão; retorna (dados, mensagem)"""
+    chave_arquivo = chave_processamento(uploaded_file, em_blocos, marcas)
+    if chave_arquivo is None:
+        return carregar_dados_com_cache(uploaded_file, em_blocos, motor_csv, marcas)
+    
+    # Lista das chaves dos arquivos que formam os dados da sessão, na ordem em que foram carregados
+    arquivos = st.session_state.get('arquivos_conjunto', [])
+    
+    # Arquivo acrescentado sem notas novas continua no seletor: mantém os dados do conjunto sem reler o arquivo
+    sem_novas = st.session_state.get('arquivo_sem_notas_novas')
+    if arquivos and sem_novas is not None and sem_novas[0] == chave_arquivo and st.session_state.get('modo_carga') == MODO_ACRESCENTAR:
+        dados = obter_dados_cache(chave_conjunto(arquivos))
+        if dados is not None:
+            return dados, sem_novas[1]
+    
+    if not arquivos or arquivos[-1] != chave_arquivo:
+        mesmo_conteudo = bool(arquivos) and arquivos[-1].split(':')[0] == chave_arquivo.split(':')[0]
+        # Só se acrescenta a dados processados com as mesmas marcas
+        mesmas_marcas = bool(arquivos) and arquivos[-1].endswith(f":{chave_marcas(marcas)}")
+        if mesmo_conteudo and mesmas_marcas:
+            # Mesmo arquivo lido em outro modo: substitui em vez de acrescentar
+            arquivos = arquivos[:-1] + [chave_arquivo]
+        elif mesmas_marcas and st.session_state.get('modo_carga') == MODO_ACRESCENTAR:
+            arquivos = arquivos + [chave_arquivo]
         else:
-            # Fallback para arquivo local (desenvolvimento)
-            try:
-                df = pd.read_csv('leaditme_base.csv', encoding='utf-8-sig')
-                data_source = "arquivo local 'leaditme_base.csv'"
-            except FileNotFoundError:
-                return pd.DataFrame(), "Nenhum arquivo encontrado. Faça upload do arquivo CSV."
-        
-        # Verificar se o DataFrame não está vazio
-        if df.empty:
-            return pd.DataFrame(), "O arquivo carregado está vazio."
-        
-        # Verificar colunas necessárias
-        colunas_necessarias = ['desc_marca', 'desc_canal_venda', 'dat_embarque', 'dat_emissao_nf', 'nom_cidade', 'num_nota_fiscal']
-        colunas_faltantes = [col for col in colunas_necessarias if col not in df.columns]
-        
-        if colunas_faltantes:
-            return pd.DataFrame(), f"Colunas faltantes no arquivo: {', '.join(colunas_faltantes)}"
-        
-        # Remove duplicados baseado na coluna NUM_NOTA_FISCAL
-        df_original_size = len(df)
-        df = df.drop_duplicates(subset=['num_nota_fiscal'], keep='first')
-        duplicados_removidos = df_original_size - len(df)
-        
-        # Renomear colunas
-        df = df.rename(columns={
-            'desc_marca': 'Marca',
-            'desc_canal_venda': 'Canal_Venda',
-            'dat_embarque': 'Data_Embarque',
-            'dat_emissao_nf': 'Data_Emissao_NF',
-            'nom_cidade': 'Cidade'
-        })
-        
-        # Converter datas
-        df['Data_Embarque'] = pd.to_datetime(df['Data_Embarque'], errors='coerce')
-        df['Data_Emissao_NF'] = pd.to_datetime(df['Data_Emissao_NF'], errors='coerce')
-        
-        # Verificar se há datas inválidas
-        datas_invalidas = df['Data_Emissao_NF'].isna().sum()
-        if datas_invalidas > 0:
-            st.warning(f"⚠️ {datas_invalidas} registros com datas inválidas foram encontrados.")
-        
-        # Remover registros com datas inválidas
-        df = df.dropna(subset=['Data_Emissao_NF'])
-        
-        # Preencher datas de embarque vazias com data de emissão da NF
-        df['Data_Embarque'] = df['Data_Embarque'].fillna(df['Data_Emissao_NF'])
-        
-        # Filtrar apenas as 3 marcas principais
-        marcas_principais = ['PAPAIZ', 'LA FONTE', 'SILVANA CD SP']
-        df_antes_filtro = len(df)
-        df = df[df['Marca'].isin(marcas_principais)]
-        registros_filtrados = df_antes_filtro - len(df)
-        
-        if df.empty:
-            return pd.DataFrame(), "Nenhum registro encontrado para as marcas suportadas (PAPAIZ, LA FONTE, SILVANA CD SP)."
-        
-        # Criar coluna de data usando data de emissão da nota fiscal
-        df['Data'] = df['Data_Emissao_NF'].dt.date
-        
-        # Criar coluna de canal agrupado
-        def agrupar_canal(canal):
-            if pd.isna(canal):
-                return 'DEMAIS CANAIS'
-            if 'WEBSHOP' in str(canal).upper():
-                return 'WEBSHOP'
-            elif 'HOME CENTER' in str(canal).upper():
-                return 'HOME CENTER'
-            else:
-                return 'DEMAIS CANAIS'
-        
-        df['Canal_Agrupado'] = df['Canal_Venda'].apply(agrupar_canal)
-        
-        def calcular_leadtime_excel(row):
-            data_emissao = row['Data_Emissao_NF']
-            data_embarque = row['Data_Embarque']
-            
-            if pd.isna(data_emissao) or pd.isna(data_embarque):
-                return 0
-            
-            if data_emissao.date() == data_embarque.date():
-                return 0
-            
-            dia_semana_emissao = data_emissao.weekday()
-            dec = 0 if dia_semana_emissao == 6 or dia_semana_emissao == 0 else 1
-            
-            try:
-                dias_uteis = np.busday_count(data_embarque.date(), data_emissao.date())
-                leadtime = dias_uteis - dec
-                return max(0, leadtime)
-            except:
-                return 0
-        
-        df['LeadTime_Dias'] = df.apply(calcular_leadtime_excel, axis=1)
-        
-        # Mensagem de sucesso com estatísticas
-        mensagem_sucesso = f"""
-        ✅ Dados processados com sucesso de {data_source}!
-        - **Registros processados:** {len(df):,}
-        - **Duplicados removidos:** {duplicados_removidos:,}
-        - **Registros filtrados:** {registros_filtrados:,}
-        - **Marcas encontradas:** {', '.join(df['Marca'].unique())}
-        """
-        
-        return df, mensagem_sucesso
-        
+            arquivos = [chave_arquivo]
+        st.session_state.arquivos_conjunto = arquivos
+    
+    if len(arquivos) == 1:
+        return carregar_dados_com_cache(uploaded_file, em_blocos, motor_csv, marcas)
+    
+    dados, mensagem, notas_novas = acrescentar_dados_com_cache(chave_conjunto(arquivos[:-1]), uploaded_file, em_blocos,
+                                                               motor_csv, marcas)
+    if dados is None:
+        # Próxima execução recomeça só com o arquivo atual
+        st.session_state.arquivos_conjunto = []
+    elif not notas_novas:
+        # O arquivo não entra no conjunto: os dados continuam os anteriores e os próximos arquivos são acrescentados a eles
+        st.session_state.arquivos_conjunto = arquivos[:-1]
+        st.session_state.arquivo_sem_notas_novas = (chave_arquivo, mensagem)
+    return dados, mensagem
+
+def chave_conjunto(arquivos):
+    """Chave dos dados formados pelos arquivos indicados, acrescentados na ordem da lista"""
+    chave = arquivos[0]
+    for chave_arquivo in arquivos[1:]:
+        chave = combinar_chaves(chave, chave_arquivo)
+    return chave
+
+def acrescentar_dados_com_cache(chave_base, uploaded_file, em_blocos=False, motor_csv='c', marcas=MARCAS_PRINCIPAIS):
+    """Processa só o arquivo novo e acrescenta aos dados já processados da chave base; retorna (dados, mensagem,
+    se o arquivo trouxe notas novas). Sem notas novas, os dados retornados são os da chave base"""
+    chave = combinar_chaves(chave_base, chave_processamento(uploaded_file, em_blocos, marcas))
+    dados = obter_dados_cache(chave)
+    if dados is not None:
+        return dados, dados.mensagem, True
+    
+    base = obter_dados_cache(chave_base)
+    if base is None:
+        return None, "Os dados anteriores não estão mais disponíveis. Faça upload do arquivo completo.", True
+    
+    # O índice é copiado porque os dados base continuam no cache e não podem mudar
+    carregar, opcoes = opcoes_carga(em_blocos, motor_csv, marcas=marcas)
+    indice = base.indice.copia()
+    df_novo, mensagem = carregar(uploaded_file, indice=indice, **opcoes)
+    if sem_notas_novas(df_novo):
+        return base, f"ℹ️ {mensagem} Os dados atuais foram mantidos ({len(base.df):,} registros).", False
+    if df_novo.empty:
+        return None, mensagem, True
+    
+    try:
+        dados = base.acrescentar(df_novo, mensagem, indice)
     except Exception as e:
-        return pd.DataFrame(), f"❌ Erro ao processar arquivo: {str(e)}"
+        return None, f"❌ Erro ao processar arquivo: {str(e)}", True
+    guardar_dados_cache(chave, dados)
+    return dados, dados.mensagem, True
 
 # MAIN APP
 def main():
+    """Executa o dashboard medindo as etapas quando o perfil de desempenho está ligado"""
+    perfil = None
+    if st.session_state.get('perfil_ativo', PERFIL_PADRAO):
+        perfil = PerfilEtapas(medir_memoria=st.session_state.get('perfil_memoria', False))
+    token = PERFIL_ATIVO.set(perfil)
+    try:
+        exibir_dashboard()
+    finally:
+        PERFIL_ATIVO.reset(token)
+        if perfil is not None:
+            perfil.encerrar()
+
+def exibir_dashboard():
     # Interface de upload
-    uploaded_file = interface_upload()
-    
-    # Só continua se houver arquivo carregado ou arquivo local disponível
-    if uploaded_file is None and 'uploaded_file' not in st.session_state:
-        st.info("👆 Por favor, faça upload do arquivo CSV para continuar.")
-        st.stop()
-    
-    # Usar arquivo da sessão se disponível
-    file_to_use = st.session_state.get('uploaded_file', uploaded_file)
-    
-    # Carregar dados
-    with st.spinner('🔄 Processando dados...'):
-        df, mensagem = carregar_dados(file_to_use)
-    
-    if df.empty:
-        st.error(mensagem)
-        st.stop()
+    uploaded_file, detalhes_arquivo = interface_upload()
+    
+    # A sessão guarda só uma referência aos dados processados, compartilhados entre as sessões
+    # que abrem o mesmo conteúdo; o arquivo enviado não fica guardado na sessão
+    referencia = st.session_state.get('dados_sessao')
+    if uploaded_file is not None:
+        marcas = st.session_state.get('marcas_analisadas', MARCAS_PRINCIPAIS)
+        if not marcas:
+            st.warning("⚠️ Selecione ao menos uma marca para processar o arquivo.")
+            st.stop()
+        
+        # Carregar dados
+        with st.spinner('🔄 Processando dados...'), etapa('Carga dos dados'):
+            dados, mensagem = carregar_dados_sessao(
+                uploaded_file,
+                st.session_state.get('processar_em_blocos', False),
+                st.session_state.get('motor_csv', 'c'),
+                marcas
+            )
+        
+        if dados is None:
+            st.error(mensagem)
+            st.stop()
+        origem = 'upload'
+    elif referencia is not None and st.session_state.get('origem_dados') == 'upload':
+        # Seletor de arquivo vazio depois de um upload: continua com os dados já carregados
+        dados, mensagem = referencia.dados, referencia.dados.mensagem
+        origem = 'upload'
+    else:
+        # Sem upload, abre os dados pré-processados pelo processar_lote.py; sem eles, pede o arquivo
+        with st.spinner('🔄 Abrindo dados pré-processados...'), etapa('Carga dos dados'):
+            dados, mensagem = carregar_artefato_com_cache(PASTA_ARTEFATO)
+        if dados is None:
+            if mensagem:
+                st.warning(f"⚠️ {mensagem}")
+            st.info("👆 Por favor, faça upload do arquivo CSV para continuar.")
+            st.stop()
+        origem = 'artefato'
+    
+    if referencia is None or referencia.dados is not dados:
+        # A referência anterior é coletada com a troca, liberando os dados antigos para descarte
+        st.session_state.dados_sessao = obter_cache_processamento().referenciar(dados)
+    st.session_state.origem_dados = origem
+    
+    # Avisos do processamento vêm junto com os dados (o módulo de processamento não conhece o Streamlit)
+    for aviso in dados.avisos:
+        st.warning(f"⚠️ {aviso}")
     
     # Mostrar mensagem de sucesso
     st.success(mensagem)
     
-    # Informações básicas dos dados
+    if detalhes_arquivo is not None:
+        memoria = dados.relatorio_memoria
+        total = memoria['Memória (MB)'].sum()
+        total_sem_compactacao = memoria['Sem compactação (MB)'].sum()
+        with detalhes_arquivo:
+            st.write(
+                f"**Memória dos dados processados:** {total:,.1f} MB "
+                f"(sem compactação: {total_sem_compactacao:,.1f} MB, {total_sem_compactacao / total:.1f}x menor)"
+            )
+            st.dataframe(memoria.style.format({'Memória (MB)': '{:.2f}', 'Sem compactação (MB)': '{:.2f}'}), use_container_width=True)
+    
+    # Informações básicas dos dados (do cubo de agregados, atualizado a cada arquivo acrescentado)
+    data_min, data_max = dados.cubo.periodo
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Total de Registros", f"{len(df):,}")
+        st.metric("Total de Registros", f"{dados.cubo.total_registros:,}")
     with col2:
-        st.metric("Lead Time Médio Geral", f"{df['LeadTime_Dias'].mean():.2f} dias")
+        st.metric("Lead Time Médio Geral", f"{dados.cubo.leadtime_medio:.2f} dias")
     with col3:
-        st.metric("Número de Marcas", df['Marca'].nunique())
+        st.metric("Número de Marcas", len(dados.cubo.marcas))
     with col4:
-        st.metric("Período", f"{df['Data'].min()} a {df['Data'].max()}")
+        st.metric("Período", f"{data_min} a {data_max}")
     
     st.markdown("---")
     
     # Filtros na sidebar
     st.sidebar.header("🔧 Filtros")
     
-    data_min = df['Data'].min()
-    data_max = df['Data'].max()
-    
     data_inicio = st.sidebar.date_input(
         "Data Início",
         value=data_min,
@@ -260,112 +416,147 @@ def main():
         max_value=data_max
     )
     
-    marcas_disponiveis = sorted(df['Marca'].unique())
+    marcas_disponiveis = dados.cubo.marcas
     marcas_selecionadas = st.sidebar.multiselect(
         "Selecionar Marcas",
         options=marcas_disponiveis,
         default=marcas_disponiveis
     )
     
-    canais_disponiveis = sorted(df['Canal_Agrupado'].unique())
+    canais_disponiveis = dados.cubo.canais
     canais_selecionados = st.sidebar.multiselect(
         "Selecionar Canais de Venda",
         options=canais_disponiveis,
         default=canais_disponiveis
     )
     
-    # Aplicar filtros
-    df_filtrado = df[
-        (df['Data'] >= data_inicio) &
-        (df['Data'] <= data_fim) &
-        (df['Marca'].isin(marcas_selecionadas)) &
-        (df['Canal_Agrupado'].isin(canais_selecionados))
-    ]
+    cache = obter_cache_processamento()
+    st.sidebar.caption(
+        f"Cache de processamento: {cache.acertos} acertos, {cache.falhas} falhas, "
+        f"{len(cache)} arquivos ({cache.em_uso} em uso) em {cache.memoria_bytes / 1024 ** 2:,.1f} de "
+        f"{cache.limite_bytes / 1024 ** 2:,.0f} MB, {cache.descartes} descartes"
+    )
+    st.sidebar.checkbox(
+        "⏱️ Medir tempo por etapa",
+        value=PERFIL_PADRAO,
+        key='perfil_ativo',
+        help="Mostra no fim da página o tempo de cada etapa (carga, filtros, gráficos, download)."
+    )
+    st.sidebar.checkbox(
+        "Medir também a memória",
+        value=False,
+        key='perfil_memoria',
+        disabled=not st.session_state.get('perfil_ativo', PERFIL_PADRAO),
+        help="Usa o tracemalloc, que vale para o servidor inteiro: enquanto estiver ligado, o processamento "
+             "de todas as sessões fica várias vezes mais lento (ex.: o CSV de download de 40 mil linhas passa "
+             "de 0,5 s para 3 a 4 s), e os valores incluem a memória usada pelas outras sessões no mesmo momento."
+    )
+    
+    # Aplicar filtros no cubo de agregados (estatísticas) e nos registros (gráficos e tabelas de detalhe)
+    with etapa('Filtros'):
+        cubo_filtrado = dados.cubo.filtrar(data_inicio, data_fim, marcas_selecionadas, canais_selecionados)
     
-    if df_filtrado.empty:
+    if cubo_filtrado.total_registros == 0:
         st.warning("⚠️ Nenhum dado encontrado com os filtros aplicados.")
         st.stop()
     
+    with etapa('Filtros'):
+        df_filtrado = dados.filtrar(data_inicio, data_fim, marcas_selecionadas, canais_selecionados)
+    
+    # Mediana e percentis exatos a partir dos histogramas do cubo
+    with etapa('Estatísticas'):
+        probabilidades = [0.5] + list(PERCENTIS_TABELA.values())
+        totais = cubo_filtrado.estatisticas_totais()
+        quantis_totais = cubo_filtrado.quantis(probabilidades)
+    
     # Mostrar dados filtrados na sidebar
     st.sidebar.markdown("---")
     st.sidebar.markdown("### 📊 Dados Filtrados")
-    st.sidebar.metric("Registros", f"{len(df_filtrado):,}")
-    st.sidebar.metric("Lead Time Médio", f"{df_filtrado['LeadTime_Dias'].mean():.2f} dias")
+    st.sidebar.metric("Registros", f"{int(totais['Total_Registros']):,}")
+    st.sidebar.metric("Lead Time Médio", f"{totais['LeadTime_Medio']:.2f} dias")
     
-    # Exibir gráficos
+    # Exibir gráficos (figuras reaproveitadas do cache enquanto dados e filtros não mudarem;
+    # a ordem da seleção não muda os gráficos)
     st.header("📈 Análises de Lead Time")
+    chave_filtros = (
+        dados.identificador,
+        data_inicio,
+        data_fim,
+        tuple(sorted(marcas_selecionadas)),
+        tuple(sorted(canais_selecionados))
+    )
+    tempos_graficos = {}
     
     # Calcular estatísticas
-    stats_gerais = df_filtrado.groupby('Marca').agg({
-        'LeadTime_Dias': ['count', 'mean', 'median', 'std', 'min', 'max']
-    })
-    stats_gerais.columns = ['Total_Registros', 'LeadTime_Medio', 'LeadTime_Mediano', 
-                           'Desvio_Padrao', 'LeadTime_Min', 'LeadTime_Max']
-    stats_gerais = stats_gerais.reset_index()
-    
-    # Calcular estatísticas diárias
-    stats_diarias = df_filtrado.groupby(['Data', 'Marca']).agg({
-        'LeadTime_Dias': ['count', 'mean']
-    })
-    stats_diarias.columns = ['Total_Registros', 'LeadTime_Medio']
-    stats_diarias = stats_diarias.reset_index()
+    with etapa('Estatísticas'):
+        stats_gerais = cubo_filtrado.estatisticas_com_quantis('Marca')
     
     # Gráfico principal
     st.subheader("Lead Time Médio por Marca")
     if not stats_gerais.empty:
-        # Calcular total geral
-        total_geral = df_filtrado['LeadTime_Dias'].mean()
-        stats_com_total = stats_gerais.copy()
-        linha_total = pd.DataFrame({
-            'Marca': ['Total'],
-            'Total_Registros': [len(df_filtrado)],
-            'LeadTime_Medio': [total_geral],
-            'LeadTime_Mediano': [df_filtrado['LeadTime_Dias'].median()],
-            'Desvio_Padrao': [df_filtrado['LeadTime_Dias'].std()],
-            'LeadTime_Min': [df_filtrado['LeadTime_Dias'].min()],
-            'LeadTime_Max': [df_filtrado['LeadTime_Dias'].max()]
-        })
-        stats_com_total = pd.concat([stats_com_total, linha_total], ignore_index=True)
+        def criar_grafico_geral():
+            """Cria gráfico de barras do lead time médio por marca, com a barra do total"""
+            import plotly.express as px
+            
+            # Calcular total geral
+            stats_com_total = stats_gerais.copy()
+            linha_total = pd.DataFrame({
+                'Marca': ['Total'],
+                'Total_Registros': [totais['Total_Registros']],
+                'LeadTime_Medio': [totais['LeadTime_Medio']],
+                'LeadTime_Mediano': [quantis_totais[0.5]],
+                'Desvio_Padrao': [totais['Desvio_Padrao']],
+                'LeadTime_Min': [totais['LeadTime_Min']],
+                'LeadTime_Max': [totais['LeadTime_Max']],
+                **{coluna: [quantis_totais[probabilidade]] for coluna, probabilidade in PERCENTIS_TABELA.items()}
+            })
+            stats_com_total = pd.concat([stats_com_total, linha_total], ignore_index=True)
+            
+            fig = px.bar(
+                stats_com_total,
+                x='Marca',
+                y='LeadTime_Medio',
+                title='Lead Time Médio por Marca',
+                labels={'LeadTime_Medio': 'Lead Time (dias)', 'Marca': 'Marca'},
+                text='LeadTime_Medio',
+                color='Marca',
+                color_discrete_map=cores_marca
+            )
+            fig.update_traces(texttemplate='%{text:.2f}', textposition='outside')
+            fig.update_layout(showlegend=False, height=500)
+            return fig
         
-        fig_geral = px.bar(
-            stats_com_total,
-            x='Marca',
-            y='LeadTime_Medio',
-            title='Lead Time Médio por Marca',
-            labels={'LeadTime_Medio': 'Lead Time (dias)', 'Marca': 'Marca'},
-            text='LeadTime_Medio',
-            color='Marca',
-            color_discrete_map=cores_marca
-        )
-        fig_geral.update_traces(texttemplate='%{text:.2f}', textposition='outside')
-        fig_geral.update_layout(showlegend=False, height=500)
+        fig_geral = obter_figura('geral', chave_filtros, criar_grafico_geral, tempos_graficos)
         st.plotly_chart(fig_geral, use_container_width=True)
     
     # Gráfico temporal
-    st.subheader("TMO Expedição Diário por Marca - Barras Agrupadas")
-    if not stats_diarias.empty:
+    # Barras por dia, semana ou mês conforme o intervalo selecionado
+    nome_periodo, adjetivo_periodo, frequencia_periodo, formato_periodo = escolher_granularidade(data_inicio, data_fim)
+    st.subheader(f"TMO Expedição {adjetivo_periodo} por Marca - Barras Agrupadas")
+    if cubo_filtrado.total_registros > 0:
         # Função para criar gráfico temporal
-        def criar_grafico_linha_temporal(stats_diarias):
-            """Cria gráfico de barras agrupadas temporal por marca"""
+        def criar_grafico_linha_temporal():
+            """Cria gráfico de barras agrupadas temporal por marca (uma barra por período e marca)"""
+            import plotly.express as px
             
-            # Converter Data para datetime se não for
-            if not pd.api.types.is_datetime64_any_dtype(stats_diarias['Data']):
-                stats_diarias = stats_diarias.copy()
-                stats_diarias['Data'] = pd.to_datetime(stats_diarias['Data'])
+            stats_periodo = cubo_filtrado.estatisticas_periodo(frequencia_periodo, ['Marca'])[
+                ['Data', 'Marca', 'Total_Registros', 'LeadTime_Medio']
+            ]
             
-            # Converter Data para string para melhor visualização
-            stats_diarias = stats_diarias.copy()
-            stats_diarias['Data_Str'] = stats_diarias['Data'].dt.strftime('%d/%m')
+            # Converter Data para string para melhor visualização (com o ano, para não repetir rótulos entre anos)
+            stats_periodo['Data_Str'] = stats_periodo['Data'].dt.strftime(formato_periodo)
             
             fig = px.bar(
-                stats_diarias,
+                stats_periodo,
                 x='Data_Str',
                 y='LeadTime_Medio',
                 color='Marca',
                 color_discrete_map=cores_marca,
-                title='Tempo Médio de Operação (TMO) - Expedição por Dia e Marca',
+                title=f'Tempo Médio de Operação (TMO) - Expedição por {nome_periodo} e Marca',
+                hover_data=['Total_Registros'],
                 labels={
-                    'Data_Str': 'Data',
+                    'Data_Str': nome_periodo,
+                    'Total_Registros': 'Registros',
                     'LeadTime_Medio': 'TMO Médio (dias)',
                     'Marca': 'Marca'
                 },
@@ -388,7 +579,7 @@ def main():
                     x=1,
                     font=dict(size=12)
                 ),
-                xaxis_title='Data',
+                xaxis_title=nome_periodo if nome_periodo != 'Semana' else 'Semana (início)',
                 yaxis_title='TMO Médio (dias)',
                 title_font_size=16,
                 xaxis_title_font_size=14,
@@ -402,46 +593,93 @@ def main():
             
             return fig
         
-        fig_temporal = criar_grafico_linha_temporal(stats_diarias)
+        fig_temporal = obter_figura('temporal', chave_filtros, criar_grafico_linha_temporal, tempos_graficos)
         st.plotly_chart(fig_temporal, use_container_width=True)
     else:
         st.warning("Não há dados suficientes para este gráfico.")
     
-    # Gráfico boxplot
+    # Gráfico boxplot com quartis calculados dos histogramas do cubo: o tamanho da figura não depende do
+    # volume de dados (cada valor atípico distinto aparece uma vez, com a quantidade de registros no hover)
     st.subheader("Distribuição do Lead Time por Marca")
-    fig_boxplot = px.box(
-        df_filtrado,
-        x='Marca',
-        y='LeadTime_Dias',
-        title='Distribuição do Lead Time por Marca',
-        labels={'LeadTime_Dias': 'Lead Time (dias)', 'Marca': 'Marca'},
-        color='Marca',
-        color_discrete_map=cores_marca
-    )
-    fig_boxplot.update_layout(showlegend=False, height=500)
+    
+    def criar_grafico_boxplot():
+        """Cria boxplot por marca a partir dos quartis e valores atípicos do cubo"""
+        import plotly.graph_objects as go
+        
+        caixas, atipicos = cubo_filtrado.estatisticas_boxplot('Marca')
+        fig = go.Figure()
+        for marca, caixa in caixas.iterrows():
+            cor = cores_marca.get(marca)
+            fig.add_trace(go.Box(
+                x=[marca],
+                name=marca,
+                q1=[caixa['q1']],
+                median=[caixa['mediana']],
+                q3=[caixa['q3']],
+                lowerfence=[caixa['cerca_inferior']],
+                upperfence=[caixa['cerca_superior']],
+                marker_color=cor
+            ))
+            pontos = atipicos[atipicos['Marca'] == marca]
+            fig.add_trace(go.Scatter(
+                x=[marca] * len(pontos),
+                y=pontos['LeadTime_Dias'],
+                name=marca,
+                mode='markers',
+                marker=dict(color=cor, size=6),
+                customdata=pontos['Registros'],
+                hovertemplate='Lead Time: %{y} dias<br>Registros: %{customdata}<extra></extra>'
+            ))
+        fig.update_layout(
+            title='Distribuição do Lead Time por Marca',
+            xaxis_title='Marca',
+            yaxis_title='Lead Time (dias)',
+            showlegend=False,
+            height=500
+        )
+        return fig
+    
+    fig_boxplot = obter_figura('boxplot', chave_filtros, criar_grafico_boxplot, tempos_graficos)
     st.plotly_chart(fig_boxplot, use_container_width=True)
     
     # Análise por canal
     if len(canais_selecionados) > 1:
         st.subheader("Lead Time Médio por Canal de Venda")
-        canal_stats = df_filtrado.groupby('Canal_Agrupado')['LeadTime_Dias'].agg(['count', 'mean'])
-        canal_stats.columns = ['Total_Registros', 'LeadTime_Medio']
-        canal_stats = canal_stats.reset_index().sort_values('LeadTime_Medio', ascending=False)
         
-        fig_canal = px.bar(
-            canal_stats,
-            x='Canal_Agrupado',
-            y='LeadTime_Medio',
-            title='Lead Time Médio por Canal de Venda',
-            labels={'LeadTime_Medio': 'Lead Time Médio (dias)', 'Canal_Agrupado': 'Canal de Venda'},
-            text='LeadTime_Medio',
-            color='Canal_Agrupado',
-            color_discrete_map=cores_canal
-        )
-        fig_canal.update_traces(texttemplate='%{text:.2f}', textposition='outside')
-        fig_canal.update_layout(showlegend=False, height=400)
+        def criar_grafico_canal():
+            """Cria gráfico de barras do lead time médio por canal de venda"""
+            import plotly.express as px
+            
+            canal_stats = cubo_filtrado.estatisticas('Canal_Agrupado')[['Canal_Agrupado', 'Total_Registros', 'LeadTime_Medio']]
+            canal_stats = canal_stats.sort_values('LeadTime_Medio', ascending=False)
+            
+            fig = px.bar(
+                canal_stats,
+                x='Canal_Agrupado',
+                y='LeadTime_Medio',
+                title='Lead Time Médio por Canal de Venda',
+                labels={'LeadTime_Medio': 'Lead Time Médio (dias)', 'Canal_Agrupado': 'Canal de Venda'},
+                text='LeadTime_Medio',
+                color='Canal_Agrupado',
+                color_discrete_map=cores_canal
+            )
+            fig.update_traces(texttemplate='%{text:.2f}', textposition='outside')
+            fig.update_layout(showlegend=False, height=400)
+            return fig
+        
+        fig_canal = obter_figura('canal', chave_filtros, criar_grafico_canal, tempos_graficos)
         st.plotly_chart(fig_canal, use_container_width=True)
     
+    # Tempo de montagem de cada gráfico nesta execução
+    cache_figuras = obter_cache_figuras()
+    st.sidebar.caption(
+        "Gráficos: " + ", ".join(
+            f"{nome} {segundos * 1000:.1f} ms" + (" (cache)" if em_cache else "")
+            for nome, (segundos, em_cache) in tempos_graficos.items()
+        ) + f". Cache de figuras: {cache_figuras.acertos} acertos, {cache_figuras.falhas} falhas, "
+        f"{len(cache_figuras)}/{cache_figuras.max_itens} figuras"
+    )
+    
     # Tabelas de dados
     st.header("📋 Tabelas de Dados")
     
@@ -456,14 +694,17 @@ def main():
             stats_display['Desvio_Padrao'] = stats_display['Desvio_Padrao'].map('{:.2f}'.format)
             stats_display['LeadTime_Min'] = stats_display['LeadTime_Min'].map('{:.2f}'.format)
             stats_display['LeadTime_Max'] = stats_display['LeadTime_Max'].map('{:.2f}'.format)
+            for coluna in PERCENTIS_TABELA:
+                stats_display[coluna] = stats_display[coluna].map('{:.2f}'.format)
             st.dataframe(stats_display, use_container_width=True)
     
     with col2:
         st.subheader("Top 10 Maiores Lead Times")
         if len(df_filtrado) > 0:
-            top_leadtimes = df_filtrado.nlargest(10, 'LeadTime_Dias')[
-                ['Marca', 'Data_Emissao_NF', 'Data_Embarque', 'LeadTime_Dias', 'Canal_Agrupado', 'Cidade']
-            ]
+            with etapa('Top 10'):
+                top_leadtimes = df_filtrado.nlargest(10, 'LeadTime_Dias')[
+                    ['Marca', 'Data_Emissao_NF', 'Data_Embarque', 'LeadTime_Dias', 'Canal_Agrupado', 'Cidade']
+                ]
             st.dataframe(top_leadtimes, use_container_width=True)
     
     # Opção para baixar dados filtrados
@@ -472,13 +713,14 @@ def main():
         st.subheader("📥 Download dos Dados")
         
         # Preparar dados para download
-        df_download = df_filtrado.copy()
-        df_download['Data_Emissao_NF'] = df_download['Data_Emissao_NF'].dt.strftime('%d/%m/%Y')
-        df_download['Data_Embarque'] = df_download['Data_Embarque'].dt.strftime('%d/%m/%Y')
-        df_download['Data'] = df_download['Data'].astype(str)
-        
-        csv_buffer = io.StringIO()
-        df_download.to_csv(csv_buffer, index=False, encoding='utf-8-sig')
+        with etapa('Download CSV'):
+            df_download = df_filtrado.copy()
+            df_download['Data_Emissao_NF'] = df_download['Data_Emissao_NF'].dt.strftime('%d/%m/%Y')
+            df_download['Data_Embarque'] = df_download['Data_Embarque'].dt.strftime('%d/%m/%Y')
+            df_download['Data'] = df_download['Data'].dt.strftime('%Y-%m-%d')
+            
+            csv_buffer = io.StringIO()
+            df_download.to_csv(csv_buffer, index=False, encoding='utf-8-sig')
         
         st.download_button(
             label="📊 Baixar dados filtrados (CSV)",
@@ -487,6 +729,22 @@ def main():
             mime="text/csv",
             help="Baixa os dados atualmente filtrados em formato CSV"
         )
+    
+    # Perfil de desempenho desta execução
+    perfil = PERFIL_ATIVO.get()
+    if perfil is not None:
+        with st.expander("⏱️ Perfil de desempenho por etapa", expanded=True):
+            st.dataframe(
+                perfil.tabela().style.format({
+                    'Tempo (ms)': '{:.1f}',
+                    **({
+                        'Memória Δ do processo (MB)': '{:.2f}',
+                        'Pico do processo (MB)': '{:.2f}'
+                    } if perfil.medir_memoria else {})
+                }),
+                use_container_width=True,
+                hide_index=True
+            )
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,11 +1,11 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 import warnings
 import hashlib
+from processamento_leadtime import processar_arquivo
 warnings.filterwarnings('ignore')
 
 # Configuração da página
@@ -145,64 +145,10 @@ cores_canal = {
     "DEMAIS CANAIS": "#2ca02c"
 }
 
-@st.cache_data
+@st.cache_resource
 def carregar_dados():
-    """Carrega e processa os dados do CSV"""
-    try:
-        df = pd.read_csv('leaditme_base.csv', encoding='utf-8-sig')
-        df = df.drop_duplicates(subset=['num_nota_fiscal'], keep='first')
-        
-        df = df.rename(columns={
-            'desc_marca': 'Marca',
-            'desc_canal_venda': 'Canal_Venda',
-            'dat_embarque': 'Data_Embarque',
-            'dat_emissao_nf': 'Data_Emissao_NF',
-            'nom_cidade': 'Cidade'
-        })
-        
-        df['Data_Embarque'] = pd.to_datetime(df['Data_Embarque'])
-        df['Data_Emissao_NF'] = pd.to_datetime(df['Data_Emissao_NF'])
-        df['Data_Embarque'] = df['Data_Embarque'].fillna(df['Data_Emissao_NF'])
-        
-        marcas_principais = ['PAPAIZ', 'LA FONTE', 'SILVANA CD SP']
-        df = df[df['Marca'].isin(marcas_principais)]
-        
-        df['Data'] = df['Data_Emissao_NF'].dt.date
-        
-        def agrupar_canal(canal):
-            if 'WEBSHOP' in canal.upper():
-                return 'WEBSHOP'
-            elif 'HOME CENTER' in canal.upper():
-                return 'HOME CENTER'
-            else:
-                return 'DEMAIS CANAIS'
-        
-        df['Canal_Agrupado'] = df['Canal_Venda'].apply(agrupar_canal)
-        
-        def calcular_leadtime_excel(row):
-            data_emissao = row['Data_Emissao_NF']
-            data_embarque = row['Data_Embarque']
-            
-            if data_emissao.date() == data_embarque.date():
-                return 0
-            
-            dia_semana_emissao = data_emissao.weekday()
-            dec = 0 if dia_semana_emissao == 6 or dia_semana_emissao == 0 else 1
-            
-            try:
-                dias_uteis = np.busday_count(data_embarque.date(), data_emissao.date())
-                leadtime = dias_uteis - dec
-                return max(0, leadtime)
-            except:
-                return 0
-        
-        df['LeadTime_Dias'] = df.apply(calcular_leadtime_excel, axis=1)
-        
-        return df
-        
-    except Exception as e:
-        st.error(f"Erro ao carregar dados: {str(e)}")
-        return pd.DataFrame()
+    """Carrega e processa o CSV local com o pipeline compartilhado; retorna (dados, mensagem)"""
+    return processar_arquivo()
 
 # MAIN APP
 def main():
@@ -214,15 +160,20 @@ def main():
     
     # Carregar dados
     with st.spinner('Carregando dados...'):
-        df = carregar_dados()
+        dados, mensagem = carregar_dados()
     
-    if df.empty:
-        st.error("❌ Não foi possível carregar os dados ou não há dados válidos.")
+    if dados is None:
+        st.error(f"❌ Não foi possível carregar os dados ou não há dados válidos. {mensagem}")
         st.stop()
     
+    for aviso in dados.avisos:
+        st.warning(f"⚠️ {aviso}")
+    
     # Informações básicas dos dados
     st.success(f"✅ Dados carregados com sucesso!")
     
+    df = dados.df
+    data_min, data_max = dados.cubo.periodo
     col1, col2, col3, col4 = st.columns(4)
     with col1:
         st.metric("Total de Registros", f"{len(df):,}")
@@ -231,16 +182,13 @@ def main():
     with col3:
         st.metric("Número de Marcas", df['Marca'].nunique())
     with col4:
-        st.metric("Período", f"{df['Data'].min()} a {df['Data'].max()}")
+        st.metric("Período", f"{data_min} a {data_max}")
     
     st.markdown("---")
     
     # Filtros na sidebar
     st.sidebar.header("🔧 Filtros")
     
-    data_min = df['Data'].min()
-    data_max = df['Data'].max()
-    
     data_inicio = st.sidebar.date_input(
         "Data Início",
         value=data_min,
@@ -255,7 +203,8 @@ def main():
         max_value=data_max
     )
     
-    marcas_disponiveis = ['PAPAIZ', 'LA FONTE', 'SILVANA CD SP']
+    # Marcas presentes nos dados (o universo analisado vem de LEADTIME_MARCAS)
+    marcas_disponiveis = dados.cubo.marcas
     marcas_selecionadas = st.sidebar.multiselect(
         "Selecionar Marcas",
         options=marcas_disponiveis,
@@ -270,12 +219,7 @@ def main():
     )
     
     # Aplicar filtros
-    df_filtrado = df[
-        (df['Data'] >= data_inicio) &
-        (df['Data'] <= data_fim) &
-        (df['Marca'].isin(marcas_selecionadas)) &
-        (df['Canal_Agrupado'].isin(canais_selecionados))
-    ]
+    df_filtrado = dados.filtrar(data_inicio, data_fim, marcas_selecionadas, canais_selecionados)
     
     if df_filtrado.empty:
         st.warning("⚠️ Nenhum dado encontrado com os filtros aplicados.")
@@ -285,7 +229,7 @@ def main():
     st.header("📈 Análises de Lead Time")
     
     # Calcular estatísticas
-    stats_gerais = df_filtrado.groupby('Marca').agg({
+    stats_gerais = df_filtrado.groupby('Marca', observed=True).agg({
         'LeadTime_Dias': ['count', 'mean', 'median', 'std', 'min', 'max']
     })
     stats_gerais.columns = ['Total_Registros', 'LeadTime_Medio', 'LeadTime_Mediano', 
@@ -340,7 +284,7 @@ def main():
     # Análise por canal
     if len(canais_selecionados) > 1:
         st.subheader("Lead Time Médio por Canal de Venda")
-        canal_stats = df_filtrado.groupby('Canal_Agrupado')['LeadTime_Dias'].agg(['count', 'mean'])
+        canal_stats = df_filtrado.groupby('Canal_Agrupado', observed=True)['LeadTime_Dias'].agg(['count', 'mean'])
         canal_stats.columns = ['Total_Registros', 'LeadTime_Medio']
         canal_stats = canal_stats.reset_index().sort_values('LeadTime_Medio', ascending=False)
         
@@ -0,0 +1,1655 @@
+"""Processamento dos dados de Lead Time, sem dependência do Streamlit.
+
+Leitura e validação do CSV, remoção de duplicados, cálculo do lead time e agregados. Avisos e erros
+voltam como dados (mensagem de retorno e `DadosProcessados.avisos`), para uso no dashboard, no
+benchmark e em jobs em lote.
+"""
+import pandas as pd
+import numpy as np
+from datetime import datetime, date
+from collections import OrderedDict, Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+import hashlib
+import threading
+import json
+import os
+import sys
+import time
+import uuid
+import weakref
+import logging
+import multiprocessing
+import tracemalloc
+
+# Colunas obrigatórias do CSV e os nomes usados no dashboard
+COLUNAS_NECESSARIAS = ['desc_marca', 'desc_canal_venda', 'dat_embarque', 'dat_emissao_nf', 'nom_cidade', 'num_nota_fiscal']
+RENOMEAR_COLUNAS = {
+    'desc_marca': 'Marca',
+    'desc_canal_venda': 'Canal_Venda',
+    'dat_embarque': 'Data_Embarque',
+    'dat_emissao_nf': 'Data_Emissao_NF',
+    'nom_cidade': 'Cidade'
+}
+
+# Tipos declarados na leitura do CSV: textos repetidos são lidos direto como categoria. A nota fiscal é
+# sempre texto: sem tipo declarado, um arquivo com alguma nota não numérica ('NF-ABC') vira uma coluna
+# mista de int e str (diferente em cada bloco) que o Arrow não grava; o IndiceNotasFiscais continua
+# tratando '000123' e 123 como a mesma nota
+TIPOS_COLUNAS = {
+    'desc_marca': 'category',
+    'desc_canal_venda': 'category',
+    'nom_cidade': 'category',
+    'num_nota_fiscal': str
+}
+
+# Linhas do arquivo usadas para estimar a memória economizada ao ler só as colunas necessárias
+LINHAS_AMOSTRA_MEMORIA = 2000
+
+# Marcas analisadas por padrão (LEADTIME_MARCAS, separadas por vírgula); registros de outras marcas
+# são descartados logo após a deduplicação, antes da conversão de datas e do lead time
+MARCAS_PRINCIPAIS = [
+    marca.strip() for marca in os.environ.get('LEADTIME_MARCAS', 'PAPAIZ,LA FONTE,SILVANA CD SP').split(',')
+    if marca.strip()
+]
+
+# Regras de agrupamento dos canais de venda: vale a primeira regra cujo trecho aparece no
+# canal (sem diferenciar maiúsculas); canais sem regra ou vazios vão para CANAL_PADRAO
+REGRAS_CANAL = [
+    ('WEBSHOP', 'WEBSHOP'),
+    ('HOME CENTER', 'HOME CENTER'),
+]
+CANAL_PADRAO = 'DEMAIS CANAIS'
+
+# Formatos de data aceitos, em ordem de preferência: vence o que converte mais datas da amostra
+# (DD/MM antes de MM/DD, como no padrão brasileiro, quando todas as datas forem ambíguas)
+FORMATOS_DATA = [
+    'ISO8601',
+    '%d/%m/%Y',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d-%m-%Y',
+    '%d.%m.%Y',
+    '%m/%d/%Y',
+    '%m/%d/%Y %H:%M:%S',
+]
+TAMANHO_AMOSTRA_DATAS = 1000
+
+# Arquivos acima deste tamanho são processados em blocos por padrão, com TAMANHO_BLOCO linhas por bloco
+LIMITE_PROCESSAMENTO_BLOCOS = 200 * 1024 * 1024
+TAMANHO_BLOCO = 250_000
+
+# Processos que processam os blocos em paralelo na leitura em blocos (1 = no próprio processo);
+# LEADTIME_TRABALHADORES=0 usa um processo por núcleo
+TRABALHADORES_PADRAO = int(os.environ.get('LEADTIME_TRABALHADORES', '1')) or os.cpu_count() or 1
+_pools = {}
+_lock_pools = threading.Lock()
+
+# Feriados descontados do lead time: CSV local com data, nome e abrangência (BR = nacional,
+# SP = estado ou cidade de São Paulo), incluindo os feriados móveis (Carnaval, Sexta-feira Santa, Corpus Christi)
+ARQUIVO_FERIADOS = os.environ.get('LEADTIME_FERIADOS', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'feriados.csv'))
+ABRANGENCIAS_FERIADOS = ['BR', 'SP']
+
+# Calendário de cada local de expedição: semana de trabalho (segunda a domingo), abrangências dos
+# feriados do arquivo e dias da semana da emissão (0 = segunda ... 6 = domingo) em que o lead time
+# não desconta o dia da emissão (regra `dec` do DIATRABALHOTOTAL original: domingo e segunda)
+CALENDARIOS_LOCAIS = {
+    'PADRAO': {'mascara': '1111100', 'abrangencias': ABRANGENCIAS_FERIADOS, 'emissao_sem_desconto': [0, 6]},
+}
+# Local de expedição de cada marca; marcas sem local usam LOCAL_PADRAO. Ex.: um CD que trabalha aos
+# sábados seria 'CD SP': {'mascara': '1111110', ...} em CALENDARIOS_LOCAIS e 'SILVANA CD SP': 'CD SP' aqui
+LOCAL_MARCA = {}
+LOCAL_PADRAO = 'PADRAO'
+
+def assinatura_calendarios(caminho=ARQUIVO_FERIADOS):
+    """Início do SHA-256 do arquivo de feriados e da configuração dos calendários, para compor chaves de cache"""
+    hash_calendarios = hashlib.sha256(json.dumps([CALENDARIOS_LOCAIS, LOCAL_MARCA], sort_keys=True).encode('utf-8'))
+    try:
+        with open(caminho, 'rb') as arquivo:
+            hash_calendarios.update(arquivo.read())
+    except OSError:
+        # Sem o arquivo a carga falha com a mensagem de erro, então nada é guardado com esta versão
+        pass
+    return hash_calendarios.hexdigest()[:8]
+
+# Versão do pipeline de processamento: altere sempre que carregar_dados mudar o resultado,
+# para que dados processados por versões anteriores não sejam reaproveitados. Inclui a assinatura
+# dos feriados e calendários, que também mudam o lead time
+VERSAO_PIPELINE = f"17-{assinatura_calendarios()}"
+
+# Contadores da carga guardados em df.attrs (somados quando arquivos são acrescentados)
+CONTADORES_CARGA = ['datas_invalidas', 'duplicados_removidos', 'registros_filtrados']
+
+class CacheLRU:
+    """Cache limitado com descarte do item usado há mais tempo (LRU) e contadores de acertos/falhas"""
+    
+    def __init__(self, max_itens):
+        self.max_itens = max_itens
+        self.acertos = 0
+        self.falhas = 0
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def obter(self, chave):
+        """Retorna o valor da chave (ou None) e marca como usado recentemente"""
+        with self._lock:
+            if chave not in self._itens:
+                self.falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return self._itens[chave]
+    
+    def guardar(self, chave, valor):
+        """Guarda o valor descartando os itens mais antigos além do limite"""
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+    
+    def __len__(self):
+        return len(self._itens)
+
+class ReferenciaDados:
+    """O que uma sessão guarda dos dados processados: uma referência aos dados compartilhados, não uma cópia"""
+    
+    def __init__(self, dados, chave):
+        self.dados = dados
+        self.chave = chave
+
+class RegistroDados:
+    """Dados processados compartilhados entre sessões e endereçados pelo conteúdo (chave de processamento).
+    
+    Os dados são imutáveis depois de processados, então cada sessão guarda só uma ReferenciaDados. Quando a
+    memória total passa de `limite_bytes`, os dados sem referências são descartados do usado há mais tempo
+    para o mais recente; dados referenciados por alguma sessão nunca são descartados.
+    
+    A liberação de uma referência roda na coleta de lixo, que pode acontecer em qualquer ponto, inclusive
+    no meio de um método do próprio registro: ela só entra numa fila, aplicada (com os descartes) no início
+    de `obter`, `guardar` e `referenciar`, então o registro nunca muda enquanto está sendo percorrido.
+    """
+    
+    def __init__(self, limite_bytes):
+        self.limite_bytes = limite_bytes
+        self.acertos = 0
+        self.falhas = 0
+        self.descartes = 0
+        self._itens = OrderedDict()
+        self._referencias = Counter()
+        self._liberadas = deque()
+        self._lock = threading.Lock()
+    
+    def obter(self, chave):
+        """Retorna os dados da chave (ou None) e marca como usados recentemente"""
+        with self._lock:
+            self._aplicar_liberacoes()
+            if chave not in self._itens:
+                self.falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return self._itens[chave]
+    
+    def guardar(self, chave, dados):
+        """Guarda os dados e descarta dados sem referências enquanto o limite de memória estiver excedido
+        (os dados recém-guardados ficam: a sessão que os carregou ainda vai referenciá-los)"""
+        with self._lock:
+            self._aplicar_liberacoes()
+            self._itens[chave] = dados
+            self._itens.move_to_end(chave)
+            self._descartar(protegida=chave)
+    
+    def referenciar(self, dados):
+        """Referência aos dados para uma sessão; os dados ficam protegidos do descarte até ela ser coletada"""
+        with self._lock:
+            self._aplicar_liberacoes()
+            chave = next((chave for chave, valor in self._itens.items() if valor is dados), None)
+            if chave is not None:
+                self._referencias[chave] += 1
+        referencia = ReferenciaDados(dados, chave)
+        if chave is not None:
+            weakref.finalize(referencia, self._liberar, chave)
+        return referencia
+    
+    def _liberar(self, chave):
+        # Chamado pela coleta de lixo: só enfileira (deque.append é atômico e não precisa do lock)
+        self._liberadas.append(chave)
+    
+    def _aplicar_liberacoes(self):
+        """Desconta as referências liberadas desde a última chamada e descarta o excesso (com o lock obtido)"""
+        if not self._liberadas:
+            return
+        while self._liberadas:
+            chave = self._liberadas.popleft()
+            self._referencias[chave] -= 1
+            if self._referencias[chave] <= 0:
+                del self._referencias[chave]
+        self._descartar()
+    
+    def _descartar(self, protegida=None):
+        excesso = self.memoria_bytes - self.limite_bytes
+        for chave in list(self._itens):
+            if excesso <= 0:
+                break
+            if self._referencias[chave] == 0 and chave != protegida:
+                excesso -= self._itens.pop(chave).memoria_bytes
+                self.descartes += 1
+    
+    @property
+    def memoria_bytes(self):
+        return sum(dados.memoria_bytes for dados in list(self._itens.values()))
+    
+    @property
+    def em_uso(self):
+        """Quantidade de dados referenciados por alguma sessão"""
+        with self._lock:
+            self._aplicar_liberacoes()
+            return len(self._referencias)
+    
+    def __len__(self):
+        return len(self._itens)
+
+# Perfil de desempenho por etapa: ligado por padrão com LEADTIME_PERFIL=1 (também dá para ligar na barra
+# lateral); com LEADTIME_PERFIL_JSON=1 cada execução medida é registrada como uma linha JSON no logger 'leadtime.perfil'
+PERFIL_PADRAO = os.environ.get('LEADTIME_PERFIL', '').lower() in ('1', 'true', 'sim')
+PERFIL_LOG_JSON = os.environ.get('LEADTIME_PERFIL_JSON', '').lower() in ('1', 'true', 'sim')
+logger_perfil = logging.getLogger('leadtime.perfil')
+if PERFIL_LOG_JSON and not logger_perfil.handlers:
+    logger_perfil.addHandler(logging.StreamHandler())
+    logger_perfil.setLevel(logging.INFO)
+
+# O tracemalloc é do processo inteiro: fica ligado enquanto houver algum perfil medindo memória
+# (contagem protegida pelo lock) e só é desligado pelo último, se foi ligado por eles
+_lock_tracemalloc = threading.Lock()
+_perfis_com_memoria = 0
+_tracemalloc_ligado_por_perfis = False
+
+def iniciar_medicao_memoria():
+    """Registra um perfil que mede memória, ligando o tracemalloc se for o primeiro"""
+    global _perfis_com_memoria, _tracemalloc_ligado_por_perfis
+    with _lock_tracemalloc:
+        if _perfis_com_memoria == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_ligado_por_perfis = True
+        _perfis_com_memoria += 1
+
+def encerrar_medicao_memoria():
+    """Retira um perfil que mede memória, desligando o tracemalloc quando não sobra nenhum"""
+    global _perfis_com_memoria, _tracemalloc_ligado_por_perfis
+    with _lock_tracemalloc:
+        _perfis_com_memoria -= 1
+        if _perfis_com_memoria == 0 and _tracemalloc_ligado_por_perfis:
+            tracemalloc.stop()
+            _tracemalloc_ligado_por_perfis = False
+
+class PerfilEtapas:
+    """Tempo e, opcionalmente, memória (tracemalloc) por etapa de uma execução; etapas com o mesmo nome
+    são somadas.
+    
+    A memória é medida no processo inteiro: com outras sessões ou threads rodando ao mesmo tempo, os
+    valores incluem as alocações delas (e os picos são zerados por todas). Enquanto algum perfil mede
+    memória, todas as alocações do processo ficam várias vezes mais lentas.
+    """
+    
+    def __init__(self, medir_memoria=False):
+        self.etapas = {}
+        self.medir_memoria = medir_memoria
+        self._picos = []
+        self._encerrado = False
+        if medir_memoria:
+            iniciar_medicao_memoria()
+    
+    def _memoria(self):
+        """(memória alocada, pico desde o último reset) do processo; zeros sem medição de memória"""
+        return tracemalloc.get_traced_memory() if self.medir_memoria else (0, 0)
+    
+    @contextmanager
+    def medir(self, nome):
+        """Mede o bloco como a etapa `nome` (etapas podem ser aninhadas)"""
+        atual_inicio, pico_anterior = self._memoria()
+        # O pico da etapa externa até aqui é guardado antes de zerar o pico para a etapa interna
+        if self._picos:
+            self._picos[-1] = max(self._picos[-1], pico_anterior)
+        if self.medir_memoria:
+            tracemalloc.reset_peak()
+        self._picos.append(atual_inicio)
+        registro = self.etapas.setdefault(nome, {
+            'nivel': len(self._picos) - 1,
+            'segundos': 0.0,
+            'chamadas': 0,
+            'memoria_delta': 0,
+            'memoria_pico': 0
+        })
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            registro['segundos'] += time.perf_counter() - inicio
+            atual, pico = self._memoria()
+            pico = max(pico, self._picos.pop())
+            if self._picos:
+                self._picos[-1] = max(self._picos[-1], pico)
+            registro['chamadas'] += 1
+            registro['memoria_delta'] += atual - atual_inicio
+            registro['memoria_pico'] = max(registro['memoria_pico'], pico - atual_inicio)
+    
+    def tabela(self):
+        """Etapas na ordem em que começaram, com as subetapas indentadas (memória só se foi medida)"""
+        megabyte = 1024 ** 2
+        return pd.DataFrame([{
+            'Etapa': '\u2003' * registro['nivel'] + ('↳ ' if registro['nivel'] else '') + nome,
+            'Tempo (ms)': registro['segundos'] * 1000,
+            'Chamadas': registro['chamadas'],
+            **({
+                'Memória Δ do processo (MB)': registro['memoria_delta'] / megabyte,
+                'Pico do processo (MB)': registro['memoria_pico'] / megabyte
+            } if self.medir_memoria else {})
+        } for nome, registro in self.etapas.items()])
+    
+    def encerrar(self):
+        """Libera a medição de memória do perfil e registra as etapas como JSON, se configurado"""
+        if self._encerrado:
+            return
+        self._encerrado = True
+        if self.medir_memoria:
+            encerrar_medicao_memoria()
+        if PERFIL_LOG_JSON:
+            logger_perfil.info(json.dumps({
+                'evento': 'perfil_leadtime',
+                'momento': datetime.now().isoformat(timespec='seconds'),
+                'etapas': [
+                    {
+                        'etapa': nome,
+                        'nivel': registro['nivel'],
+                        'segundos': round(registro['segundos'], 6),
+                        'chamadas': registro['chamadas'],
+                        'memoria_delta_bytes': registro['memoria_delta'],
+                        'memoria_pico_bytes': registro['memoria_pico']
+                    }
+                    for nome, registro in self.etapas.items()
+                ]
+            }, ensure_ascii=False))
+
+# Perfil da execução atual do script (cada sessão roda na sua thread, então o valor não se mistura entre sessões)
+PERFIL_ATIVO = ContextVar('perfil_ativo', default=None)
+
+def etapa(nome):
+    """Contexto que mede o bloco no perfil da execução atual; sem perfil ativo não faz nada"""
+    perfil = PERFIL_ATIVO.get()
+    return perfil.medir(nome) if perfil is not None else nullcontext()
+
+# Percentis de lead time exibidos na tabela de estatísticas (além da mediana)
+PERCENTIS_TABELA = {'LeadTime_P90': 0.90, 'LeadTime_P95': 0.95, 'LeadTime_P99': 0.99}
+
+# Valores atípicos distintos exibidos por marca no boxplot (o restante é amostrado entre os extremos)
+MAX_OUTLIERS_BOXPLOT = 100
+
+# Granularidades do gráfico temporal, da mais fina para a mais grossa: (nome, adjetivo do título,
+# frequência do período no pandas, formato do rótulo). Usa a mais fina com até MAX_PERIODOS_GRAFICO_TEMPORAL barras por marca
+GRANULARIDADES_TEMPORAIS = [
+    ('Dia', 'Diário', 'D', '%d/%m/%Y'),
+    ('Semana', 'Semanal', 'W', '%d/%m/%Y'),
+    ('Mês', 'Mensal', 'M', '%m/%Y'),
+    ('Ano', 'Anual', 'Y', '%Y'),
+]
+MAX_PERIODOS_GRAFICO_TEMPORAL = 45
+
+# Pasta dos snapshots colunares (Arrow) dos dados processados e quantos manter em disco
+PASTA_SNAPSHOTS = os.environ.get('LEADTIME_SNAPSHOTS', '.leadtime_snapshots')
+MAX_SNAPSHOTS = 20
+
+# Pasta dos dados pré-processados pelo processar_lote.py, abertos pelo dashboard quando não há upload
+PASTA_ARTEFATO = os.environ.get('LEADTIME_ARTEFATO', 'leadtime_processado')
+ARQUIVO_DADOS_ARTEFATO = 'dados.arrow'
+ARQUIVO_MANIFESTO = 'manifesto.json'
+
+def escolher_granularidade(data_inicio, data_fim):
+    """Granularidade mais fina do gráfico temporal com no máximo MAX_PERIODOS_GRAFICO_TEMPORAL períodos no intervalo"""
+    for granularidade in GRANULARIDADES_TEMPORAIS:
+        if len(pd.period_range(data_inicio, data_fim, freq=granularidade[2])) <= MAX_PERIODOS_GRAFICO_TEMPORAL:
+            return granularidade
+    return GRANULARIDADES_TEMPORAIS[-1]
+
+def ler_feriados(caminho=ARQUIVO_FERIADOS, abrangencias=ABRANGENCIAS_FERIADOS):
+    """Datas dos feriados do CSV nas abrangências pedidas (datetime64[D] ordenado e sem repetições)"""
+    feriados = pd.read_csv(caminho, usecols=['data', 'abrangencia'], dtype=str)
+    datas = pd.to_datetime(feriados.loc[feriados['abrangencia'].isin(abrangencias), 'data'], format='ISO8601')
+    return np.unique(datas.to_numpy().astype('datetime64[D]'))
+
+class CalendarioDiasUteis:
+    """Dias úteis de uma semana de trabalho (`mascara`, segunda a domingo) descontando feriados, e os
+    dias da semana da emissão sem o desconto de um dia no lead time.
+    
+    Guarda o total acumulado de dias úteis antes de cada data do intervalo coberto: a contagem entre
+    duas datas é a diferença de duas posições do array, com o mesmo resultado do np.busday_count.
+    """
+    def __init__(self, feriados=(), mascara='1111100', emissao_sem_desconto=(0, 6)):
+        self.mascara = mascara
+        self.emissao_sem_desconto = tuple(emissao_sem_desconto)
+        self.calendario = np.busdaycalendar(weekmask=mascara, holidays=np.asarray(feriados, dtype='datetime64[D]'))
+        # (primeira data coberta, acumulado), trocados juntos: leituras concorrentes veem um par consistente
+        self._tabela = None
+    
+    @property
+    def feriados(self):
+        """Feriados que caem em dias de trabalho da máscara (os demais não mudam a contagem)"""
+        return self.calendario.holidays
+    
+    def _cobrir(self, menor, maior):
+        """Tabela de acumulados que cobre as datas de `menor` a `maior` (e o dia seguinte), ampliada em anos inteiros"""
+        tabela = self._tabela
+        if tabela is not None:
+            inicio, acumulado = tabela
+            ultima = inicio + (len(acumulado) - 1)
+            if menor >= inicio and maior < ultima:
+                return tabela
+            menor, maior = min(menor, inicio), max(maior, ultima)
+        inicio = menor.astype('datetime64[Y]').astype('datetime64[D]')
+        fim = (maior.astype('datetime64[Y]') + 1).astype('datetime64[D]')
+        uteis = np.is_busday(np.arange(inicio, fim), busdaycal=self.calendario)
+        # acumulado[i] = dias úteis de `inicio` (inclusive) até `inicio + i` (exclusive)
+        self._tabela = (inicio, np.concatenate([[0], np.cumsum(uteis, dtype=np.int64)]))
+        return self._tabela
+    
+    def contar(self, inicio, fim):
+        """Dias úteis de `inicio` (inclusive) a `fim` (exclusive), como no np.busday_count: se `fim` vier
+        antes, conta de `fim` (exclusive) a `inicio` (inclusive), negativo. Arrays datetime64[D] sem datas vazias"""
+        inicio = np.asarray(inicio, dtype='datetime64[D]')
+        fim = np.asarray(fim, dtype='datetime64[D]')
+        if inicio.size == 0:
+            return np.zeros(inicio.shape, dtype=np.int64)
+        origem, acumulado = self._cobrir(min(inicio.min(), fim.min()), max(inicio.max(), fim.max()))
+        posicao_inicio = (inicio - origem).astype(np.int64)
+        posicao_fim = (fim - origem).astype(np.int64)
+        invertidos = posicao_fim < posicao_inicio
+        return acumulado[posicao_fim + invertidos] - acumulado[posicao_inicio + invertidos]
+
+_calendarios = {}
+_lock_calendarios = threading.Lock()
+
+def obter_calendario(abrangencias=ABRANGENCIAS_FERIADOS, mascara='1111100', emissao_sem_desconto=(0, 6),
+                     caminho=ARQUIVO_FERIADOS):
+    """Calendário com os feriados do arquivo, criado uma vez por processo e combinação de opções"""
+    chave = (tuple(abrangencias), mascara, tuple(emissao_sem_desconto), caminho)
+    with _lock_calendarios:
+        if chave not in _calendarios:
+            _calendarios[chave] = CalendarioDiasUteis(ler_feriados(caminho, abrangencias), mascara, emissao_sem_desconto)
+        return _calendarios[chave]
+
+def calendario_local(local=LOCAL_PADRAO):
+    """Calendário configurado em CALENDARIOS_LOCAIS para o local de expedição"""
+    return obter_calendario(**CALENDARIOS_LOCAIS[local])
+
+def calendario_marca(marca):
+    """Calendário do local de expedição da marca"""
+    return calendario_local(LOCAL_MARCA.get(marca, LOCAL_PADRAO))
+
+def calcular_leadtime_vetorizado(data_embarque, data_emissao, calendario=None):
+    """Calcula o lead time em dias úteis (DIATRABALHOTOTAL.INTL do Excel com a lista de feriados) para
+    colunas inteiras de datas; sem `calendario`, usa o calendário do local padrão"""
+    if calendario is None:
+        calendario = calendario_local()
+    embarque = np.asarray(data_embarque, dtype='datetime64[D]')
+    emissao = np.asarray(data_emissao, dtype='datetime64[D]')
+    
+    leadtime = np.zeros(len(emissao), dtype=np.int64)
+    
+    # Datas vazias ou embarque no mesmo dia da emissão têm lead time zero
+    validos = ~(np.isnat(embarque) | np.isnat(emissao)) & (embarque != emissao)
+    if not validos.any():
+        return leadtime
+    
+    embarque = embarque[validos]
+    emissao = emissao[validos]
+    
+    # 1970-01-01 foi uma quinta-feira: (dias + 3) % 7 dá 0 = segunda ... 6 = domingo
+    dia_semana_emissao = (emissao.astype(np.int64) + 3) % 7
+    dec = np.where(np.isin(dia_semana_emissao, calendario.emissao_sem_desconto), 0, 1)
+    
+    dias_uteis = calendario.contar(embarque, emissao)
+    leadtime[validos] = np.maximum(0, dias_uteis - dec)
+    return leadtime
+
+def calcular_leadtime_por_marca(marca, data_embarque, data_emissao):
+    """Lead time com o calendário do local de expedição de cada marca, calculado de uma vez para todas
+    as linhas das marcas de um mesmo local"""
+    marca = marca.astype('category')
+    embarque = np.asarray(data_embarque, dtype='datetime64[D]')
+    emissao = np.asarray(data_emissao, dtype='datetime64[D]')
+    
+    # Local de cada categoria e, na última posição, o das marcas vazias (código -1)
+    locais = np.array([LOCAL_MARCA.get(valor, LOCAL_PADRAO) for valor in marca.cat.categories] + [LOCAL_PADRAO])
+    presentes = np.unique(locais)
+    if len(presentes) == 1:
+        return calcular_leadtime_vetorizado(embarque, emissao, calendario_local(presentes[0]))
+    
+    locais_linhas = locais[marca.cat.codes.to_numpy()]
+    leadtime = np.zeros(len(marca), dtype=np.int64)
+    for local in presentes:
+        linhas = locais_linhas == local
+        if linhas.any():
+            leadtime[linhas] = calcular_leadtime_vetorizado(embarque[linhas], emissao[linhas], calendario_local(local))
+    return leadtime
+
+def calcular_hash_arquivo(arquivo):
+    """Calcula o hash SHA-256 do conteúdo de um arquivo aberto em modo binário"""
+    hash_arquivo = hashlib.sha256()
+    arquivo.seek(0)
+    for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+        hash_arquivo.update(bloco)
+    arquivo.seek(0)
+    return hash_arquivo.hexdigest()
+
+def memoria_sem_compactacao(coluna):
+    """Memória em bytes que a coluna ocuparia sem a compactação (textos e datas como objetos Python, inteiros int64)"""
+    if isinstance(coluna.dtype, pd.CategoricalDtype):
+        # Cada linha teria o ponteiro mais o objeto string, como conta o memory_usage(deep=True)
+        tamanhos = np.array([sys.getsizeof(valor) for valor in coluna.cat.categories], dtype=np.int64)
+        codigos = coluna.cat.codes.to_numpy()
+        contagens = np.bincount(codigos[codigos >= 0], minlength=len(tamanhos))
+        vazios = int((codigos < 0).sum()) * sys.getsizeof(np.nan)
+        return 8 * len(coluna) + int(contagens @ tamanhos) + vazios
+    if coluna.name == 'Data':
+        return (8 + sys.getsizeof(date.today())) * len(coluna)
+    if pd.api.types.is_integer_dtype(coluna):
+        return 8 * len(coluna)
+    return int(coluna.memory_usage(deep=True, index=False))
+
+def relatorio_memoria(df):
+    """Memória por coluna do DataFrame processado, comparada com a representação sem compactação"""
+    megabyte = 1024 ** 2
+    return pd.DataFrame({
+        'Tipo': df.dtypes.astype(str),
+        'Memória (MB)': df.memory_usage(deep=True, index=False) / megabyte,
+        'Sem compactação (MB)': pd.Series({coluna: memoria_sem_compactacao(df[coluna]) for coluna in df.columns}) / megabyte
+    })
+
+def tipar_dados_processados(df):
+    """Converte as colunas processadas para tipos compactos (categorias e inteiros pequenos)"""
+    df = df.copy()
+    for coluna in ['Marca', 'Canal_Venda', 'Canal_Agrupado', 'Cidade']:
+        # Categorias lidas do CSV incluem marcas e canais que foram filtrados
+        df[coluna] = df[coluna].astype('category').cat.remove_unused_categories()
+    # Datas vazias do ERP (ex.: 01/01/1900) dão lead times acima do int16, que voltariam negativos: nesses
+    # arquivos a coluna fica int32 (o lead time nunca é negativo)
+    leadtime = df['LeadTime_Dias'].to_numpy()
+    cabe_int16 = not len(leadtime) or leadtime.max() <= np.iinfo(np.int16).max
+    df['LeadTime_Dias'] = df['LeadTime_Dias'].astype(np.int16 if cabe_int16 else np.int32)
+    return df
+
+def combinar_chaves(chave_base, chave_arquivo):
+    """Chave dos dados formados por um conjunto já processado acrescido de mais um arquivo"""
+    return hashlib.sha256(f"{chave_base}+{chave_arquivo}".encode('utf-8')).hexdigest() + f":{VERSAO_PIPELINE}:acumulado"
+
+def caminho_snapshot(chave):
+    """Caminho do snapshot Arrow correspondente à chave de processamento"""
+    return os.path.join(PASTA_SNAPSHOTS, chave.replace(':', '_') + '.arrow')
+
+def caminho_indice_snapshot(caminho):
+    """Caminho do arquivo com o índice de notas fiscais que acompanha um snapshot"""
+    return caminho[:-len('.arrow')] + '.notas.npz'
+
+def caminho_cubo_snapshot(caminho):
+    """Caminho do arquivo com o cubo de agregados que acompanha um snapshot"""
+    return caminho[:-len('.arrow')] + '.cubo.npz'
+
+def gravar_dados_arrow(caminho, dados):
+    """Grava o DataFrame processado em formato colunar Arrow (Feather v2, sem compressão) junto com o
+    índice de notas e o cubo de agregados. Tudo é gravado em temporários e só então renomeado, então uma
+    falha nunca deixa um índice novo ao lado de dados antigos; exige o pyarrow"""
+    pendentes = []
+    try:
+        preparar_dados_arrow(caminho, dados, pendentes)
+        renomear_temporarios(pendentes)
+    finally:
+        descartar_temporarios(pendentes)
+
+def caminho_temporario(caminho):
+    """Arquivo temporário gravado ao lado de `caminho` antes de ser renomeado para ele"""
+    return f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def preparar_dados_arrow(caminho, dados, pendentes):
+    """Grava dados, índice de notas e cubo em arquivos temporários, acrescentando a `pendentes` os pares
+    (temporário, final) na ordem em que devem ser renomeados; exige o pyarrow"""
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    
+    tabela = pa.Table.from_pandas(dados.df)
+    metadados = dict(tabela.schema.metadata or {})
+    metadados[b'leadtime'] = json.dumps({
+        'mensagem': dados.mensagem,
+        'attrs': dados.df.attrs,
+    }).encode('utf-8')
+    tabela = tabela.replace_schema_metadata(metadados)
+    
+    # O .arrow é renomeado por último: os dados só são considerados válidos com ele presente
+    for caminho_final, objeto in [(caminho_indice_snapshot(caminho), dados.indice), (caminho_cubo_snapshot(caminho), dados.cubo)]:
+        pendentes.append((caminho_temporario(caminho_final), caminho_final))
+        with open(pendentes[-1][0], 'wb') as arquivo:
+            objeto.salvar(arquivo)
+    pendentes.append((caminho_temporario(caminho), caminho))
+    feather.write_feather(tabela, pendentes[-1][0], compression='uncompressed')
+
+def renomear_temporarios(pendentes):
+    """Renomeia os temporários já gravados para os nomes finais, na ordem"""
+    for caminho_tmp, caminho_final in pendentes:
+        os.replace(caminho_tmp, caminho_final)
+
+def descartar_temporarios(pendentes):
+    """Remove temporários que sobraram de uma gravação que falhou"""
+    for caminho_tmp, _ in pendentes:
+        try:
+            os.remove(caminho_tmp)
+        except OSError:
+            pass
+
+def ler_dados_arrow(caminho):
+    """Lê dados gravados por gravar_dados_arrow via memory-map; retorna DadosProcessados"""
+    import pyarrow.feather as feather
+    
+    tabela = feather.read_table(caminho, memory_map=True)
+    metadados = json.loads(tabela.schema.metadata[b'leadtime'].decode('utf-8'))
+    df = tabela.to_pandas()
+    with open(caminho_indice_snapshot(caminho), 'rb') as arquivo_indice:
+        indice = IndiceNotasFiscais.carregar(arquivo_indice)
+    
+    # Snapshots gravados antes do cubo ser guardado montam o cubo a partir dos registros
+    cubo = None
+    if os.path.exists(caminho_cubo_snapshot(caminho)):
+        with open(caminho_cubo_snapshot(caminho), 'rb') as arquivo_cubo:
+            cubo = CuboLeadTime.carregar(arquivo_cubo)
+    df.attrs.update(metadados['attrs'])
+    return DadosProcessados(df, metadados['mensagem'], indice, cubo)
+
+def salvar_snapshot(chave, dados):
+    """Grava o snapshot dos dados processados da chave; retorna False se não foi possível"""
+    try:
+        os.makedirs(PASTA_SNAPSHOTS, exist_ok=True)
+        gravar_dados_arrow(caminho_snapshot(chave), dados)
+    except Exception:
+        # Snapshot é só otimização: sem pyarrow, ou com colunas que o Arrow não representa, o app funciona igual
+        return False
+    
+    # Mantém apenas os snapshots mais recentes
+    snapshots = sorted(
+        (os.path.join(PASTA_SNAPSHOTS, nome) for nome in os.listdir(PASTA_SNAPSHOTS) if nome.endswith('.arrow')),
+        key=os.path.getmtime,
+        reverse=True
+    )
+    for antigo in snapshots[MAX_SNAPSHOTS:]:
+        for caminho_antigo in (antigo, caminho_indice_snapshot(antigo), caminho_cubo_snapshot(antigo)):
+            try:
+                os.remove(caminho_antigo)
+            except OSError:
+                pass
+    return True
+
+def ler_snapshot(chave):
+    """Lê o snapshot Arrow da chave via memory-map; retorna DadosProcessados ou None"""
+    caminho = caminho_snapshot(chave)
+    if not os.path.exists(caminho):
+        return None
+    try:
+        dados = ler_dados_arrow(caminho)
+    except Exception:
+        return None
+    
+    # Marca o arquivo como usado recentemente para a limpeza por idade
+    os.utime(caminho)
+    return dados
+
+def opcoes_carga(em_blocos=False, motor_csv='c', trabalhadores=TRABALHADORES_PADRAO, marcas=MARCAS_PRINCIPAIS):
+    """Função de carga e suas opções conforme o modo escolhido no upload"""
+    # Leitura em blocos usa sempre o leitor 'c'; o resultado não depende do leitor nem do número de
+    # processos, então eles ficam fora da chave (as marcas entram)
+    if em_blocos:
+        return carregar_dados_em_blocos, {'trabalhadores': trabalhadores, 'marcas': list(marcas)}
+    return carregar_dados, {'motor_csv': motor_csv, 'marcas': list(marcas)}
+
+def chave_marcas(marcas):
+    """Texto que identifica o conjunto de marcas analisadas nas chaves de cache e no manifesto"""
+    return '|'.join(sorted(marcas))
+
+class IndiceNotasFiscais:
+    """Notas fiscais já vistas, guardadas como arrays ordenados de inteiros (deduplicação global)"""
+    
+    def __init__(self):
+        # Notas numéricas ficam como int64; notas com texto ficam como hash de 64 bits do texto
+        self._numericas = np.empty(0, dtype=np.int64)
+        self._textos = np.empty(0, dtype=np.uint64)
+        self._viu_nula = False
+    
+    def __len__(self):
+        return len(self._numericas) + len(self._textos) + int(self._viu_nula)
+    
+    @property
+    def memoria_bytes(self):
+        return self._numericas.nbytes + self._textos.nbytes
+    
+    def copia(self):
+        """Cópia independente do índice"""
+        copia = IndiceNotasFiscais()
+        copia._numericas = self._numericas.copy()
+        copia._textos = self._textos.copy()
+        copia._viu_nula = self._viu_nula
+        return copia
+    
+    def salvar(self, arquivo):
+        """Grava o índice em formato .npz"""
+        np.savez(arquivo, numericas=self._numericas, textos=self._textos, viu_nula=self._viu_nula)
+    
+    @classmethod
+    def carregar(cls, arquivo):
+        """Lê um índice gravado por salvar()"""
+        conteudo = np.load(arquivo)
+        indice = cls()
+        indice._numericas = conteudo['numericas']
+        indice._textos = conteudo['textos']
+        indice._viu_nula = bool(conteudo['viu_nula'])
+        return indice
+    
+    @staticmethod
+    def _classificar(notas):
+        """Separa as notas em numéricas (como int64), textos (como hash) e nulas"""
+        notas = pd.Series(notas).reset_index(drop=True)
+        nulas = notas.isna().to_numpy()
+        
+        if pd.api.types.is_integer_dtype(notas.dtype):
+            numeros = notas.to_numpy(dtype=np.int64)
+            return numeros, np.ones(len(notas), dtype=bool), np.zeros(0, dtype=np.uint64), nulas
+        
+        # Caso comum da leitura como texto: só dígitos ASCII, convertidos direto (bem mais rápido que o to_numeric)
+        if not nulas.any() and notas.dtype == object and notas.str.isdigit().all() and ''.join(notas.to_numpy()).isascii():
+            try:
+                numeros = notas.astype(np.int64).to_numpy()
+                return numeros, np.ones(len(notas), dtype=bool), np.zeros(0, dtype=np.uint64), nulas
+            except (ValueError, OverflowError):
+                # Notas com mais de 18 dígitos não cabem em int64: seguem o caminho geral
+                pass
+        
+        # '000123', 123 e 123.0 são a mesma nota, como já acontece quando o pandas lê a coluna como número
+        valores = pd.to_numeric(notas, errors='coerce').to_numpy(dtype=np.float64)
+        eh_numero = ~np.isnan(valores) & (valores == np.floor(valores)) & (np.abs(valores) < 2 ** 63)
+        numeros = np.zeros(len(notas), dtype=np.int64)
+        numeros[eh_numero] = valores[eh_numero].astype(np.int64)
+        
+        eh_texto = ~eh_numero & ~nulas
+        textos = pd.util.hash_array(notas[eh_texto].astype(str).to_numpy(dtype=object))
+        return numeros, eh_numero, textos, nulas
+    
+    @staticmethod
+    def _contidas(ordenadas, chaves):
+        """Máscara das chaves presentes no array ordenado (busca binária)"""
+        if len(ordenadas) == 0 or len(chaves) == 0:
+            return np.zeros(len(chaves), dtype=bool)
+        posicoes = np.minimum(np.searchsorted(ordenadas, chaves), len(ordenadas) - 1)
+        return ordenadas[posicoes] == chaves
+    
+    @staticmethod
+    def _registrar(ordenadas, chaves):
+        """Acrescenta chaves novas mantendo o array ordenado (merge de dois trechos ordenados)"""
+        if len(chaves) == 0:
+            return ordenadas
+        return np.sort(np.concatenate([ordenadas, np.sort(chaves)]), kind='stable')
+    
+    def marcar_novas(self, notas):
+        """Registra as notas e retorna máscara True na primeira ocorrência de cada nota ainda não vista"""
+        numeros, eh_numero, textos, nulas = self._classificar(notas)
+        novas = np.zeros(len(numeros), dtype=bool)
+        
+        chaves = numeros[eh_numero]
+        primeira = ~pd.Series(chaves).duplicated(keep='first').to_numpy() & ~self._contidas(self._numericas, chaves)
+        novas[eh_numero] = primeira
+        self._numericas = self._registrar(self._numericas, chaves[primeira])
+        
+        primeira = ~pd.Series(textos).duplicated(keep='first').to_numpy() & ~self._contidas(self._textos, textos)
+        novas[~eh_numero & ~nulas] = primeira
+        self._textos = self._registrar(self._textos, textos[primeira])
+        
+        # Notas vazias contam como uma única nota, como no drop_duplicates
+        posicoes_nulas = np.flatnonzero(nulas)
+        if len(posicoes_nulas) and not self._viu_nula:
+            novas[posicoes_nulas[0]] = True
+            self._viu_nula = True
+        
+        return novas
+
+class CuboLeadTime:
+    """Agregados de lead time por (Data, Marca, Canal_Agrupado): contagem, soma, soma dos quadrados,
+    mínimo, máximo e histograma do lead time de cada célula.
+    
+    Os histogramas são esparsos: uma tripla (célula, dia, registros) por lead time presente em cada célula,
+    ordenadas por célula e dia. O tamanho acompanha os valores distintos, não o maior lead time, então
+    uma data digitada com o ano errado não multiplica a memória do cubo.
+    """
+    
+    CHAVES = ['Data', 'Marca', 'Canal_Agrupado']
+    AGREGACOES = {
+        'contagem': 'sum',
+        'soma': 'sum',
+        'soma_quadrados': 'sum',
+        'minimo': 'min',
+        'maximo': 'max'
+    }
+    
+    def __init__(self, celulas, histograma_celula, histograma_dia, histograma_registros):
+        self.celulas = celulas
+        self.histograma_celula = histograma_celula
+        self.histograma_dia = histograma_dia
+        self.histograma_registros = histograma_registros
+    
+    @staticmethod
+    def _somar_triplas(celula, dia, registros):
+        """Ordena as triplas (célula, dia, registros) por célula e dia e soma as repetidas"""
+        celula = np.asarray(celula, dtype=np.int64)
+        dia = np.asarray(dia, dtype=np.int64)
+        registros = np.asarray(registros, dtype=np.int64)
+        if not len(dia):
+            return celula.astype(np.int32), dia.astype(np.int32), registros
+        
+        # Uma chave inteira por (célula, dia): uma ordenação só, mais rápida que o lexsort
+        dia_minimo = dia.min()
+        chave = celula * (dia.max() - dia_minimo + 1) + (dia - dia_minimo)
+        ordem = np.argsort(chave, kind='stable')
+        chave = chave[ordem]
+        inicios = np.flatnonzero(np.r_[True, chave[1:] != chave[:-1]])
+        primeiros = ordem[inicios]
+        return (
+            celula[primeiros].astype(np.int32),
+            dia[primeiros].astype(np.int32),
+            np.add.reduceat(registros[ordem], inicios)
+        )
+    
+    @classmethod
+    def de_dataframe(cls, df):
+        """Monta o cubo a partir do DataFrame processado"""
+        leadtime = df['LeadTime_Dias'].to_numpy().astype(np.int64)
+        grupos = df[cls.CHAVES].assign(
+            _leadtime=leadtime,
+            _leadtime_quadrado=leadtime * leadtime
+        ).groupby(cls.CHAVES, observed=True)
+        celulas = grupos.agg(
+            contagem=('_leadtime', 'size'),
+            soma=('_leadtime', 'sum'),
+            soma_quadrados=('_leadtime_quadrado', 'sum'),
+            minimo=('_leadtime', 'min'),
+            maximo=('_leadtime', 'max')
+        )
+        
+        triplas = cls._somar_triplas(grupos.ngroup().to_numpy(), leadtime, np.ones(len(leadtime), dtype=np.int64))
+        return cls(celulas, *triplas)
+    
+    def salvar(self, arquivo):
+        """Grava o cubo em formato .npz (marca e canal como códigos das categorias)"""
+        indice = self.celulas.index
+        niveis = {}
+        for nivel in ['Marca', 'Canal_Agrupado']:
+            # pd.Categorical mantém as categorias de um nível categórico e cria as de um nível de texto
+            valores = pd.Categorical(indice.get_level_values(nivel))
+            niveis[f'{nivel}_codigos'] = valores.codes
+            niveis[f'{nivel}_categorias'] = np.asarray(valores.categories, dtype=str)
+        np.savez(
+            arquivo,
+            datas=indice.get_level_values('Data').to_numpy(),
+            histograma_celula=self.histograma_celula,
+            histograma_dia=self.histograma_dia,
+            histograma_registros=self.histograma_registros,
+            **{coluna: self.celulas[coluna].to_numpy() for coluna in self.AGREGACOES},
+            **niveis
+        )
+    
+    @classmethod
+    def carregar(cls, arquivo):
+        """Lê um cubo gravado por salvar()"""
+        conteudo = np.load(arquivo)
+        indice = pd.MultiIndex.from_arrays([
+            pd.DatetimeIndex(conteudo['datas']),
+            *[
+                pd.CategoricalIndex(pd.Categorical.from_codes(conteudo[f'{nivel}_codigos'], conteudo[f'{nivel}_categorias']))
+                for nivel in ['Marca', 'Canal_Agrupado']
+            ]
+        ], names=cls.CHAVES)
+        celulas = pd.DataFrame({coluna: conteudo[coluna] for coluna in cls.AGREGACOES}, index=indice)
+        return cls(celulas, conteudo['histograma_celula'], conteudo['histograma_dia'], conteudo['histograma_registros'])
+    
+    def _com_categorias(self, categorias):
+        """Células com os níveis Marca e Canal_Agrupado usando as categorias indicadas"""
+        indice = self.celulas.index
+        return self.celulas.set_axis(pd.MultiIndex.from_arrays([
+            indice.get_level_values('Data'),
+            *[pd.Categorical(indice.get_level_values(nivel), categories=categorias[nivel]) for nivel in ['Marca', 'Canal_Agrupado']]
+        ], names=self.CHAVES))
+    
+    def combinar(self, outro):
+        """Novo cubo somando as células dos dois cubos"""
+        # Níveis categóricos com categorias diferentes (ex.: arquivo acrescentado com outras marcas) virariam
+        # texto no concat: os dois cubos passam a usar a união das categorias
+        categorias = {
+            nivel: pd.api.types.union_categoricals(
+                [pd.Categorical(cubo.celulas.index.get_level_values(nivel)) for cubo in [self, outro]],
+                sort_categories=True
+            ).categories
+            for nivel in ['Marca', 'Canal_Agrupado']
+        }
+        partes = [self._com_categorias(categorias), outro._com_categorias(categorias)]
+        grupos = pd.concat(partes).groupby(level=self.CHAVES, observed=True)
+        celulas = grupos.agg(self.AGREGACOES)
+        
+        # Célula do cubo combinado de cada célula dos dois cubos (na ordem do concat)
+        novas = grupos.ngroup().to_numpy()
+        triplas = self._somar_triplas(
+            np.concatenate([novas[:len(self.celulas)][self.histograma_celula], novas[len(self.celulas):][outro.histograma_celula]]),
+            np.concatenate([self.histograma_dia, outro.histograma_dia]),
+            np.concatenate([self.histograma_registros, outro.histograma_registros])
+        )
+        return CuboLeadTime(celulas, *triplas)
+    
+    def filtrar(self, data_inicio, data_fim, marcas, canais):
+        """Sub-cubo com as células do período e das marcas e canais selecionados"""
+        indice = self.celulas.index
+        datas = indice.get_level_values('Data')
+        mascara = (
+            (datas >= pd.Timestamp(data_inicio)) &
+            (datas <= pd.Timestamp(data_fim)) &
+            indice.get_level_values('Marca').isin(marcas) &
+            indice.get_level_values('Canal_Agrupado').isin(canais)
+        )
+        
+        # As triplas mantidas continuam ordenadas: só as células são renumeradas
+        mascara = np.asarray(mascara)
+        mantidas = mascara[self.histograma_celula]
+        novas = (np.cumsum(mascara) - 1).astype(np.int32)
+        return CuboLeadTime(
+            self.celulas[mascara],
+            novas[self.histograma_celula[mantidas]],
+            self.histograma_dia[mantidas],
+            self.histograma_registros[mantidas]
+        )
+    
+    @staticmethod
+    def _estatisticas(agregado):
+        """Contagem, média, desvio padrão amostral, mínimo e máximo a partir das somas"""
+        contagem = agregado['contagem'].astype(float)
+        media = agregado['soma'] / contagem
+        variancia = ((agregado['soma_quadrados'] - agregado['soma'] * media) / (contagem - 1)).clip(lower=0)
+        return pd.DataFrame({
+            'Total_Registros': agregado['contagem'],
+            'LeadTime_Medio': media,
+            'Desvio_Padrao': np.sqrt(variancia).where(contagem > 1),
+            'LeadTime_Min': agregado['minimo'],
+            'LeadTime_Max': agregado['maximo']
+        })
+    
+    def estatisticas(self, niveis):
+        """Estatísticas de lead time agrupando as células pelos níveis indicados"""
+        agregado = self.celulas.groupby(level=niveis, observed=True).agg(self.AGREGACOES)
+        return self._estatisticas(agregado).reset_index()
+    
+    def estatisticas_totais(self):
+        """Estatísticas de lead time de todas as células juntas"""
+        agregado = self.celulas.agg(self.AGREGACOES).to_frame().T
+        return self._estatisticas(agregado).iloc[0]
+    
+    def estatisticas_periodo(self, frequencia, niveis):
+        """Estatísticas de lead time por período da Data (início do dia, semana ou mês) e pelos níveis indicados"""
+        indice = self.celulas.index
+        periodos = indice.get_level_values('Data').to_period(frequencia).start_time.rename('Data')
+        chaves = [periodos] + [indice.get_level_values(nivel) for nivel in niveis]
+        agregado = self.celulas.groupby(chaves, observed=True).agg(self.AGREGACOES)
+        return self._estatisticas(agregado).reset_index()
+    
+    def histogramas_agrupados(self, niveis):
+        """Soma os histogramas das células por grupo; retorna (índice dos grupos, triplas (grupo, dia, registros))"""
+        grupos = self.celulas.groupby(level=niveis, observed=True)
+        grupo = grupos.ngroup().to_numpy()[self.histograma_celula]
+        return grupos.size().index, self._somar_triplas(grupo, self.histograma_dia, self.histograma_registros)
+    
+    @staticmethod
+    def _limites_grupos(grupo, quantidade):
+        """Posição da primeira tripla de cada grupo e da seguinte à última (triplas ordenadas por grupo)"""
+        return np.searchsorted(grupo, np.arange(quantidade)), np.searchsorted(grupo, np.arange(quantidade), side='right')
+    
+    @classmethod
+    def quantis_histograma(cls, triplas, quantidade, probabilidades):
+        """Quantis exatos dos histogramas esparsos de `quantidade` grupos (uma linha por grupo), com a
+        interpolação linear do pandas/numpy"""
+        grupo, dia, registros = triplas
+        probabilidades = np.asarray(probabilidades, dtype=float)
+        if not len(dia):
+            return np.full((quantidade, len(probabilidades)), np.nan)
+        acumulado = np.r_[0, np.cumsum(registros)]
+        inicio, fim = cls._limites_grupos(grupo, quantidade)
+        anteriores = acumulado[inicio][:, None]
+        total = acumulado[fim][:, None] - anteriores
+        
+        # Posição (base 0) de cada quantil nos valores ordenados do grupo; o valor na posição k é o dia
+        # da primeira tripla do grupo cujo acumulado passa de k
+        posicoes = np.maximum(total - 1, 0) * probabilidades
+        inferior = np.floor(posicoes)
+        fracao = posicoes - inferior
+        ultima = len(dia) - 1
+        valor_inferior = dia[np.minimum(np.searchsorted(acumulado[1:], anteriores + inferior, side='right'), ultima)]
+        valor_superior = dia[np.minimum(np.searchsorted(acumulado[1:], anteriores + np.ceil(posicoes), side='right'), ultima)]
+        
+        # Mesma fórmula de interpolação do numpy (estável para fração >= 0.5)
+        diferenca = (valor_superior - valor_inferior).astype(float)
+        quantis = np.where(
+            fracao >= 0.5,
+            valor_superior - diferenca * (1 - fracao),
+            valor_inferior + diferenca * fracao
+        )
+        return np.where(total > 0, quantis, np.nan)
+    
+    def quantis(self, probabilidades, niveis=None):
+        """Quantis exatos de lead time por grupo (DataFrame com uma coluna por probabilidade) ou do total (Series)"""
+        if niveis is None:
+            triplas = self._somar_triplas(np.zeros(len(self.histograma_dia)), self.histograma_dia, self.histograma_registros)
+            return pd.Series(self.quantis_histograma(triplas, 1, probabilidades)[0], index=probabilidades)
+        grupos, triplas = self.histogramas_agrupados(niveis)
+        return pd.DataFrame(self.quantis_histograma(triplas, len(grupos), probabilidades), index=grupos, columns=probabilidades)
+    
+    def estatisticas_com_quantis(self, niveis, percentis=PERCENTIS_TABELA):
+        """Estatísticas por grupo com a mediana e os percentis indicados (exatos, a partir dos histogramas)"""
+        agregado = self.celulas.groupby(level=niveis, observed=True).agg(self.AGREGACOES)
+        estatisticas = self._estatisticas(agregado)
+        quantis = self.quantis([0.5] + list(percentis.values()), niveis).reindex(estatisticas.index)
+        estatisticas.insert(2, 'LeadTime_Mediano', quantis[0.5].to_numpy())
+        for coluna, probabilidade in percentis.items():
+            estatisticas[coluna] = quantis[probabilidade].to_numpy()
+        return estatisticas.reset_index()
+    
+    def estatisticas_boxplot(self, nivel, max_outliers=MAX_OUTLIERS_BOXPLOT):
+        """Quartis e limites dos bigodes por grupo (maior/menor valor dentro de 1,5 × IQR, como no Plotly) e os
+        valores atípicos distintos de cada grupo com a quantidade de registros; retorna (caixas, atipicos)"""
+        grupos, triplas = self.histogramas_agrupados(nivel)
+        grupo, dia, registros = triplas
+        q1, mediana, q3 = self.quantis_histograma(triplas, len(grupos), [0.25, 0.5, 0.75]).T
+        iqr = q3 - q1
+        
+        # Todo grupo tem a mediana dentro dos limites, então as cercas sempre existem
+        cerca_inferior = np.full(len(grupos), np.iinfo(np.int64).max)
+        cerca_superior = np.full(len(grupos), np.iinfo(np.int64).min)
+        dentro_inferior = dia >= (q1 - 1.5 * iqr)[grupo]
+        dentro_superior = dia <= (q3 + 1.5 * iqr)[grupo]
+        np.minimum.at(cerca_inferior, grupo[dentro_inferior], dia[dentro_inferior])
+        np.maximum.at(cerca_superior, grupo[dentro_superior], dia[dentro_superior])
+        caixas = pd.DataFrame({
+            'q1': q1,
+            'mediana': mediana,
+            'q3': q3,
+            'cerca_inferior': cerca_inferior,
+            'cerca_superior': cerca_superior
+        }, index=grupos)
+        
+        atipicos = []
+        for nome, inicio, fim, inferior, superior in zip(grupos, *self._limites_grupos(grupo, len(grupos)), cerca_inferior, cerca_superior):
+            valores, quantidades = dia[inicio:fim].astype(np.int64), registros[inicio:fim]
+            fora = np.flatnonzero((valores < inferior) | (valores > superior))
+            if len(fora) > max_outliers:
+                fora = fora[np.linspace(0, len(fora) - 1, max_outliers).round().astype(int)]
+            atipicos.append(pd.DataFrame({nivel: nome, 'LeadTime_Dias': valores[fora], 'Registros': quantidades[fora]}))
+        return caixas, pd.concat(atipicos, ignore_index=True)
+    
+    @property
+    def memoria_bytes(self):
+        return int(self.celulas.memory_usage(deep=True).sum()) + sum(
+            triplas.nbytes for triplas in [self.histograma_celula, self.histograma_dia, self.histograma_registros]
+        )
+    
+    @property
+    def total_registros(self):
+        return int(self.celulas['contagem'].sum())
+    
+    @property
+    def leadtime_medio(self):
+        return self.celulas['soma'].sum() / self.total_registros
+    
+    @property
+    def marcas(self):
+        return sorted(self.celulas.index.get_level_values('Marca').unique())
+    
+    @property
+    def canais(self):
+        return sorted(self.celulas.index.get_level_values('Canal_Agrupado').unique())
+    
+    @property
+    def periodo(self):
+        datas = self.celulas.index.get_level_values('Data')
+        return datas.min().date(), datas.max().date()
+
+class DadosProcessados:
+    """Dados processados de um ou mais arquivos: DataFrame (ordenado por data), mensagem, índice de notas
+    fiscais e cubo de agregados"""
+    
+    def __init__(self, df, mensagem, indice, cubo=None):
+        # Ordenado por data (estável, mantendo a ordem do arquivo no mesmo dia) para filtrar o período por busca binária
+        if not df['Data'].is_monotonic_increasing:
+            with etapa('Ordenação por data'):
+                df = df.sort_values('Data', kind='stable')
+        self.df = df
+        self.mensagem = mensagem
+        self.indice = indice
+        if cubo is None:
+            with etapa('Cubo de agregados'):
+                cubo = CuboLeadTime.de_dataframe(df)
+        self.cubo = cubo
+        # Identifica estes dados nas chaves do cache de figuras (novos dados nunca reaproveitam figuras antigas)
+        self.identificador = uuid.uuid4().hex
+        self._relatorio_memoria = None
+        self._memoria_bytes = None
+    
+    @property
+    def relatorio_memoria(self):
+        """Memória por coluna, calculada uma vez (os dados não mudam depois de processados)"""
+        if self._relatorio_memoria is None:
+            self._relatorio_memoria = relatorio_memoria(self.df)
+        return self._relatorio_memoria
+    
+    @property
+    def memoria_bytes(self):
+        """Memória ocupada pelos registros, cubo e índice de notas, calculada uma vez"""
+        if self._memoria_bytes is None:
+            self._memoria_bytes = (
+                int(self.df.memory_usage(deep=True).sum()) + self.cubo.memoria_bytes + self.indice.memoria_bytes
+            )
+        return self._memoria_bytes
+    
+    @property
+    def avisos(self):
+        """Avisos do processamento a exibir junto com os dados (também quando vêm do cache ou de um snapshot)"""
+        avisos = []
+        datas_invalidas = self.df.attrs.get('datas_invalidas', 0)
+        if datas_invalidas > 0:
+            avisos.append(f"{datas_invalidas} registros com datas inválidas foram encontrados.")
+        return avisos
+    
+    @staticmethod
+    def _mascara_categorias(coluna, valores):
+        """Máscara das linhas cuja categoria está em `valores`, comparando só as categorias e indexando pelos códigos"""
+        selecionadas = np.append(coluna.cat.categories.isin(valores), False)  # código -1 (vazio) não é selecionado
+        return selecionadas[coluna.cat.codes.to_numpy()]
+    
+    def filtrar(self, data_inicio, data_fim, marcas, canais):
+        """Registros do período e das marcas e canais selecionados"""
+        datas = self.df['Data'].to_numpy()
+        inicio = datas.searchsorted(np.datetime64(pd.Timestamp(data_inicio)), side='left')
+        fim = datas.searchsorted(np.datetime64(pd.Timestamp(data_fim)), side='right')
+        periodo = self.df.iloc[inicio:fim]
+        
+        mascara = self._mascara_categorias(periodo['Marca'], marcas) & self._mascara_categorias(periodo['Canal_Agrupado'], canais)
+        if mascara.all():
+            return periodo
+        return periodo[mascara]
+    
+    def acrescentar(self, df_novo, mensagem_novo, indice):
+        """Novos dados com as linhas de df_novo acrescentadas; os dados atuais não são alterados"""
+        df = concatenar_blocos([self.df, df_novo], ignorar_indice=True)
+        somar_contadores_carga(df, [self.df, df_novo])
+        
+        # Só as linhas novas são agregadas; o cubo existente é combinado com elas
+        cubo = self.cubo.combinar(CuboLeadTime.de_dataframe(df_novo))
+        mensagem = mensagem_novo.rstrip() + f"""
+        - **Total acumulado:** {len(df):,} registros
+        """
+        return DadosProcessados(df, mensagem, indice, cubo)
+
+def somar_contadores_carga(df, partes):
+    """Guarda em df.attrs a soma dos contadores da carga (CONTADORES_CARGA) dos DataFrames que o formam"""
+    for contador in CONTADORES_CARGA:
+        df.attrs[contador] = sum(parte.attrs.get(contador, 0) for parte in partes)
+
+def abrir_fonte_dados(uploaded_file=None):
+    """Retorna o arquivo a ser lido e a descrição da origem, ou (None, None) se não houver arquivo"""
+    # Caminho de arquivo (processamento em lote)
+    if isinstance(uploaded_file, (str, os.PathLike)):
+        return os.fspath(uploaded_file), f"arquivo '{os.path.basename(uploaded_file)}'"
+    if uploaded_file is not None:
+        # Reset do ponteiro do arquivo
+        uploaded_file.seek(0)
+        return uploaded_file, f"arquivo carregado '{uploaded_file.name}'"
+    
+    # Fallback para arquivo local (desenvolvimento)
+    if os.path.exists('leaditme_base.csv'):
+        return 'leaditme_base.csv', "arquivo local 'leaditme_base.csv'"
+    return None, None
+
+def motores_csv_disponiveis():
+    """Leitores de CSV disponíveis: 'c' (padrão do pandas) e 'pyarrow' (multithread), se instalado"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return ['c']
+    return ['c', 'pyarrow']
+
+def reiniciar_fonte(fonte):
+    """Volta ao início do arquivo carregado (caminhos locais são reabertos a cada leitura)"""
+    if hasattr(fonte, 'seek'):
+        fonte.seek(0)
+
+def ler_cabecalho(fonte):
+    """Lê apenas os nomes das colunas do CSV"""
+    colunas = pd.read_csv(fonte, encoding='utf-8-sig', nrows=0).columns
+    reiniciar_fonte(fonte)
+    return colunas
+
+def ler_csv_colunas_necessarias(fonte, motor_csv='c', **opcoes):
+    """Lê do CSV só as colunas obrigatórias, com os tipos declarados em TIPOS_COLUNAS"""
+    # O leitor pyarrow já ignora o BOM e não aceita 'utf-8-sig'
+    encoding = 'utf-8' if motor_csv == 'pyarrow' else 'utf-8-sig'
+    return pd.read_csv(
+        fonte,
+        encoding=encoding,
+        usecols=COLUNAS_NECESSARIAS,
+        dtype=TIPOS_COLUNAS,
+        engine=motor_csv,
+        **opcoes
+    )
+
+def descrever_leitura_colunas(fonte, colunas, total_registros):
+    """Resumo das colunas lidas com a memória economizada estimada a partir de uma amostra do arquivo"""
+    amostra = pd.read_csv(fonte, encoding='utf-8-sig', nrows=LINHAS_AMOSTRA_MEMORIA)
+    reiniciar_fonte(fonte)
+    if amostra.empty:
+        return f"{len(COLUNAS_NECESSARIAS)} de {len(colunas)}"
+    
+    memoria_completa = amostra.memory_usage(deep=True).sum()
+    memoria_reduzida = amostra[COLUNAS_NECESSARIAS].astype(TIPOS_COLUNAS).memory_usage(deep=True).sum()
+    economia_mb = (memoria_completa - memoria_reduzida) / len(amostra) * total_registros / 1024 ** 2
+    return f"{len(COLUNAS_NECESSARIAS)} de {len(colunas)} (≈ {economia_mb:,.1f} MB de memória economizados)"
+
+def verificar_colunas(colunas):
+    """Retorna a mensagem de erro com as colunas obrigatórias ausentes, ou None"""
+    colunas_faltantes = [col for col in COLUNAS_NECESSARIAS if col not in colunas]
+    if colunas_faltantes:
+        return f"Colunas faltantes no arquivo: {', '.join(colunas_faltantes)}"
+    return None
+
+def classificar_canal(canal, regras=REGRAS_CANAL):
+    """Grupo de um canal de venda segundo a tabela de regras"""
+    if pd.isna(canal):
+        return CANAL_PADRAO
+    canal = str(canal).upper()
+    for trecho, grupo in regras:
+        if trecho in canal:
+            return grupo
+    return CANAL_PADRAO
+
+def agrupar_canais(canais, regras=REGRAS_CANAL):
+    """Agrupa uma coluna de canais classificando cada canal distinto uma única vez (códigos categóricos)"""
+    categorias = sorted({CANAL_PADRAO} | {grupo for _, grupo in regras})
+    codigos, distintos = pd.factorize(canais)
+    
+    # Tabela canal distinto -> código do grupo; a última posição atende o código -1 (canal vazio)
+    tabela = np.array(
+        [categorias.index(classificar_canal(canal, regras)) for canal in distintos] + [categorias.index(CANAL_PADRAO)],
+        dtype=np.int8
+    )
+    return pd.Categorical.from_codes(tabela[codigos], categories=categorias)
+
+def detectar_formato_data(amostra):
+    """Formato de FORMATOS_DATA que converte mais valores da amostra, ou None se nenhum converter"""
+    melhor_formato, melhor_convertidas = None, 0
+    for formato in FORMATOS_DATA:
+        convertidas = pd.to_datetime(amostra, format=formato, errors='coerce').notna().sum()
+        if convertidas > melhor_convertidas:
+            melhor_formato, melhor_convertidas = formato, convertidas
+            if convertidas == len(amostra):
+                break
+    return melhor_formato
+
+def converter_datas(valores, formato=None):
+    """Converte uma coluna de datas convertendo cada data distinta uma única vez; retorna (datas, formato)"""
+    if pd.api.types.is_datetime64_any_dtype(valores):
+        return valores, formato
+    
+    codigos, distintas = pd.factorize(valores)
+    if formato is None:
+        formato = detectar_formato_data(distintas[:TAMANHO_AMOSTRA_DATAS])
+    
+    if formato is not None:
+        convertidas = pd.to_datetime(distintas, format=formato, errors='coerce')
+    else:
+        # Sem formato reconhecido: inferência do pandas, como antes
+        convertidas = pd.to_datetime(distintas, errors='coerce')
+    
+    # Código -1 (data vazia) vira NaT
+    datas = pd.DatetimeIndex(convertidas).take(codigos, allow_fill=True, fill_value=pd.NaT)
+    return pd.Series(datas, index=valores.index), formato
+
+def filtrar_marcas(df, marcas):
+    """Mantém só os registros das marcas analisadas (coluna do CSV, antes de renomear); retorna
+    (registros, quantidade descartada)"""
+    with etapa('Filtro de marcas'):
+        manter = df['desc_marca'].isin(marcas)
+        return df[manter], int(len(df) - manter.sum())
+
+def processar_bloco(df, formatos_data=None):
+    """Converte datas e calcula canal e lead time de um bloco já sem duplicados e só com as marcas analisadas.
+    
+    `formatos_data` guarda o formato detectado de cada coluna de data para os próximos blocos.
+    """
+    if formatos_data is None:
+        formatos_data = {}
+    
+    # Renomear colunas
+    df = df.rename(columns=RENOMEAR_COLUNAS)
+    
+    # Converter datas
+    with etapa('Conversão de datas'):
+        for coluna in ['Data_Embarque', 'Data_Emissao_NF']:
+            df[coluna], formatos_data[coluna] = converter_datas(df[coluna], formatos_data.get(coluna))
+    
+    # Verificar se há datas inválidas
+    datas_invalidas = int(df['Data_Emissao_NF'].isna().sum())
+    
+    # Remover registros com datas inválidas
+    df = df.dropna(subset=['Data_Emissao_NF'])
+    
+    # Preencher datas de embarque vazias com data de emissão da NF
+    df['Data_Embarque'] = df['Data_Embarque'].fillna(df['Data_Emissao_NF'])
+    
+    # Criar coluna de data usando data de emissão da nota fiscal (datetime64 sem hora, não objetos date)
+    df['Data'] = df['Data_Emissao_NF'].dt.normalize()
+    
+    # Criar coluna de canal agrupado
+    with etapa('Agrupamento de canais'):
+        df['Canal_Agrupado'] = agrupar_canais(df['Canal_Venda'])
+    
+    with etapa('Cálculo do lead time'):
+        df['LeadTime_Dias'] = calcular_leadtime_por_marca(df['Marca'], df['Data_Embarque'], df['Data_Emissao_NF'])
+    
+    return df, datas_invalidas
+
+def processar_bloco_tipado(bloco, formatos_data):
+    """processar_bloco seguido da tipagem compacta; executado também nos processos do pool"""
+    bloco, datas_invalidas = processar_bloco(bloco, formatos_data)
+    if not bloco.empty:
+        with etapa('Tipagem compacta'):
+            bloco = tipar_dados_processados(bloco)
+    return bloco, datas_invalidas
+
+def obter_pool(trabalhadores):
+    """Pool de processos reaproveitado entre cargas (criar processos custa mais que um bloco)"""
+    with _lock_pools:
+        if trabalhadores not in _pools:
+            # 'spawn' evita herdar por fork as threads do servidor do Streamlit
+            _pools[trabalhadores] = ProcessPoolExecutor(trabalhadores, mp_context=multiprocessing.get_context('spawn'))
+        return _pools[trabalhadores]
+
+def descartar_pool(trabalhadores):
+    """Encerra o pool (ex.: depois que um processo morreu); o próximo uso cria outro"""
+    with _lock_pools:
+        pool = _pools.pop(trabalhadores, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def concatenar_blocos(blocos, ignorar_indice=False):
+    """Concatena blocos processados mantendo as colunas categóricas com categorias unificadas"""
+    colunas = list(blocos[0].columns)
+    categoricas = list(blocos[0].select_dtypes('category').columns)
+    
+    # Os blocos de entrada não são alterados: podem ser dados compartilhados pelo cache
+    df = pd.concat([bloco.drop(columns=categoricas) for bloco in blocos], ignore_index=ignorar_indice)
+    for coluna in categoricas:
+        valores = pd.api.types.union_categoricals([bloco[coluna] for bloco in blocos], sort_categories=True)
+        df.insert(colunas.index(coluna), coluna, valores)
+    return df
+
+def resultado_sem_notas_novas(data_source, duplicados_removidos):
+    """Resultado da carga de um arquivo cujas notas fiscais já estavam todas no índice (ex.: o arquivo de
+    ontem enviado de novo): DataFrame vazio marcado em attrs, para não ser confundido com um erro"""
+    df = pd.DataFrame()
+    df.attrs['sem_notas_novas'] = True
+    return df, (f"Nenhuma nota fiscal nova no {data_source}: as notas dos {duplicados_removidos:,} registros "
+                f"já estão nos dados carregados.")
+
+def sem_notas_novas(df):
+    """Se a carga não trouxe registros porque todas as notas fiscais já tinham sido carregadas"""
+    return df.attrs.get('sem_notas_novas', False)
+
+def montar_mensagem_sucesso(df, data_source, duplicados_removidos, registros_filtrados, colunas_lidas):
+    """Mensagem de sucesso com estatísticas do processamento"""
+    return f"""
+        ✅ Dados processados com sucesso de {data_source}!
+        - **Registros processados:** {len(df):,}
+        - **Duplicados removidos:** {duplicados_removidos:,}
+        - **Registros filtrados:** {registros_filtrados:,}
+        - **Marcas encontradas:** {', '.join(df['Marca'].unique())}
+        - **Colunas lidas:** {colunas_lidas}
+        """
+
+def carregar_dados(uploaded_file=None, indice=None, motor_csv='c', marcas=MARCAS_PRINCIPAIS):
+    """Carrega e processa os dados do CSV"""
+    if indice is None:
+        indice = IndiceNotasFiscais()
+    try:
+        fonte, data_source = abrir_fonte_dados(uploaded_file)
+        if fonte is None:
+            return pd.DataFrame(), "Nenhum arquivo encontrado. Faça upload do arquivo CSV."
+        
+        # Verificar colunas necessárias lendo só o cabeçalho; depois lê apenas essas colunas
+        colunas = ler_cabecalho(fonte)
+        erro_colunas = verificar_colunas(colunas)
+        if erro_colunas:
+            return pd.DataFrame(), erro_colunas
+        with etapa('Leitura do CSV'):
+            df = ler_csv_colunas_necessarias(fonte, motor_csv)
+        
+        # Verificar se o DataFrame não está vazio
+        if df.empty:
+            return pd.DataFrame(), "O arquivo carregado está vazio."
+        
+        # Remove duplicados baseado na coluna NUM_NOTA_FISCAL (inclusive notas já vistas pelo índice)
+        with etapa('Remoção de duplicados'):
+            df_original_size = len(df)
+            df = df[indice.marcar_novas(df['num_nota_fiscal'])]
+            duplicados_removidos = df_original_size - len(df)
+        if df.empty:
+            return resultado_sem_notas_novas(data_source, duplicados_removidos)
+        
+        # As notas das outras marcas já entraram no índice: continuam contando como vistas
+        df, registros_filtrados = filtrar_marcas(df, marcas)
+        df, datas_invalidas = processar_bloco(df)
+        
+        if df.empty:
+            return pd.DataFrame(), f"Nenhum registro encontrado para as marcas analisadas ({', '.join(marcas)})."
+        
+        with etapa('Tipagem compacta'):
+            df = tipar_dados_processados(df)
+        reiniciar_fonte(fonte)
+        with etapa('Estimativa de memória'):
+            colunas_lidas = descrever_leitura_colunas(fonte, colunas, df_original_size)
+        mensagem_sucesso = montar_mensagem_sucesso(df, data_source, duplicados_removidos, registros_filtrados, colunas_lidas)
+        
+        # Guardado junto ao DataFrame para o aviso aparecer também quando vier do cache
+        df.attrs['datas_invalidas'] = datas_invalidas
+        df.attrs['duplicados_removidos'] = duplicados_removidos
+        df.attrs['registros_filtrados'] = registros_filtrados
+        
+        return df, mensagem_sucesso
+    
+    except Exception as e:
+        return pd.DataFrame(), f"❌ Erro ao processar arquivo: {str(e)}"
+
+def carregar_dados_em_blocos(uploaded_file=None, tamanho_bloco=TAMANHO_BLOCO, indice=None, trabalhadores=TRABALHADORES_PADRAO,
+                             marcas=MARCAS_PRINCIPAIS):
+    """Carrega o CSV em blocos, mantendo em memória apenas as colunas necessárias já processadas.
+    
+    Com `trabalhadores` > 1, datas, marcas, canais e lead time de cada bloco são calculados em um pool
+    de processos; leitura e remoção de duplicados continuam aqui, na ordem do arquivo.
+    """
+    if indice is None:
+        indice = IndiceNotasFiscais()
+    try:
+        fonte, data_source = abrir_fonte_dados(uploaded_file)
+        if fonte is None:
+            return pd.DataFrame(), "Nenhum arquivo encontrado. Faça upload do arquivo CSV."
+        
+        # Verificar colunas necessárias lendo só o cabeçalho
+        colunas = ler_cabecalho(fonte)
+        erro_colunas = verificar_colunas(colunas)
+        if erro_colunas:
+            return pd.DataFrame(), erro_colunas
+        
+        # Leitura em blocos só é suportada pelo leitor 'c'
+        leitor = ler_csv_colunas_necessarias(fonte, 'c', chunksize=tamanho_bloco)
+        
+        # Cada item é um resultado de processar_bloco_tipado ou o Future que vai produzi-lo
+        resultados = []
+        pendentes = deque()
+        pool = obter_pool(trabalhadores) if trabalhadores > 1 else None
+        formatos_data = {}
+        total_registros = 0
+        duplicados_removidos = 0
+        registros_filtrados = 0
+        
+        while True:
+            with etapa('Leitura do CSV'):
+                bloco = next(leitor, None)
+            if bloco is None:
+                break
+            total_registros += len(bloco)
+            
+            # Remove duplicados dentro do bloco e notas já vistas em blocos anteriores (mantém a primeira)
+            with etapa('Remoção de duplicados'):
+                novas = indice.marcar_novas(bloco['num_nota_fiscal'])
+                duplicados_removidos += int(len(bloco) - novas.sum())
+            
+            # Outras marcas saem antes das datas e do lead time (e de ir para o pool); as notas delas já
+            # entraram no índice e continuam contando como vistas nos próximos blocos
+            bloco, filtrados_bloco = filtrar_marcas(bloco[novas], marcas)
+            registros_filtrados += filtrados_bloco
+            
+            # Os blocos só vão para o pool depois que os formatos de data foram detectados aqui,
+            # para que todos usem o mesmo formato
+            if pool is not None and all(formatos_data.get(coluna) for coluna in ['Data_Embarque', 'Data_Emissao_NF']):
+                # Limita os blocos em espera para não manter o arquivo inteiro em memória
+                if len(pendentes) >= 2 * trabalhadores:
+                    with etapa('Processamento paralelo'):
+                        pendentes.popleft().result()
+                futuro = pool.submit(processar_bloco_tipado, bloco, formatos_data.copy())
+                pendentes.append(futuro)
+                resultados.append(futuro)
+            else:
+                resultados.append(processar_bloco_tipado(bloco, formatos_data))
+        
+        with etapa('Processamento paralelo'):
+            resultados = [item.result() if hasattr(item, 'result') else item for item in resultados]
+        blocos = [bloco for bloco, _ in resultados if not bloco.empty]
+        datas_invalidas = sum(invalidas for _, invalidas in resultados)
+        
+        if total_registros == 0:
+            return pd.DataFrame(), "O arquivo carregado está vazio."
+        if duplicados_removidos == total_registros:
+            return resultado_sem_notas_novas(data_source, duplicados_removidos)
+        if not blocos:
+            return pd.DataFrame(), f"Nenhum registro encontrado para as marcas analisadas ({', '.join(marcas)})."
+        
+        with etapa('Concatenação dos blocos'):
+            df = concatenar_blocos(blocos)
+        reiniciar_fonte(fonte)
+        with etapa('Estimativa de memória'):
+            colunas_lidas = descrever_leitura_colunas(fonte, colunas, total_registros)
+        mensagem_sucesso = montar_mensagem_sucesso(df, data_source, duplicados_removidos, registros_filtrados, colunas_lidas)
+        df.attrs['datas_invalidas'] = datas_invalidas
+        df.attrs['duplicados_removidos'] = duplicados_removidos
+        df.attrs['registros_filtrados'] = registros_filtrados
+        
+        return df, mensagem_sucesso
+    
+    except BrokenProcessPool:
+        descartar_pool(trabalhadores)
+        return pd.DataFrame(), "❌ Erro ao processar arquivo: um processo do processamento paralelo foi encerrado (memória insuficiente?)"
+    except Exception as e:
+        return pd.DataFrame(), f"❌ Erro ao processar arquivo: {str(e)}"
+
+
+def processar_arquivo(uploaded_file=None, em_blocos=False, motor_csv='c', indice=None, marcas=MARCAS_PRINCIPAIS):
+    """Carrega e processa um arquivo (ou o CSV local) sem cache; retorna (DadosProcessados ou None, mensagem)"""
+    if indice is None:
+        indice = IndiceNotasFiscais()
+    carregar, opcoes = opcoes_carga(em_blocos, motor_csv, marcas=marcas)
+    df, mensagem = carregar(uploaded_file, indice=indice, **opcoes)
+    if df.empty:
+        return None, mensagem
+    try:
+        return DadosProcessados(df, mensagem, indice), mensagem
+    except Exception as e:
+        return None, f"❌ Erro ao processar arquivo: {str(e)}"
+
+def tabelas_agregadas(cubo):
+    """Agregados exportados pelo processamento em lote: por marca, por dia e marca e por canal"""
+    return {
+        'stats_gerais': cubo.estatisticas_com_quantis('Marca'),
+        'stats_diarias': cubo.estatisticas_com_quantis(['Data', 'Marca']),
+        'stats_canal': cubo.estatisticas_com_quantis('Canal_Agrupado')
+    }
+
+def gravar_json(caminho, conteudo):
+    """Grava JSON em arquivo temporário e renomeia (quem lê nunca vê o arquivo pela metade)"""
+    caminho_tmp = caminho_temporario(caminho)
+    with open(caminho_tmp, 'w', encoding='utf-8') as arquivo:
+        json.dump(conteudo, arquivo, ensure_ascii=False, indent=2)
+    os.replace(caminho_tmp, caminho)
+
+def salvar_artefato(pasta, dados, arquivos, marcas=MARCAS_PRINCIPAIS):
+    """Grava na pasta os dados processados (Arrow, como os snapshots), os agregados em CSV e o manifesto
+    com os arquivos de origem; o manifesto é gravado por último e identifica a geração. Retorna o manifesto.
+    
+    Todos os arquivos são gravados em temporários antes de qualquer renomeação: se algo falhar, a pasta
+    continua com a geração anterior inteira (dados, índice de notas e manifesto) e o erro é propagado.
+    """
+    os.makedirs(pasta, exist_ok=True)
+    manifesto = {
+        'versao_pipeline': VERSAO_PIPELINE,
+        'gerado_em': datetime.now().isoformat(),
+        'registros': len(dados.df),
+        'marcas': chave_marcas(marcas),
+        'arquivos': arquivos
+    }
+    
+    pendentes = []
+    try:
+        preparar_dados_arrow(os.path.join(pasta, ARQUIVO_DADOS_ARTEFATO), dados, pendentes)
+        for nome, tabela in tabelas_agregadas(dados.cubo).items():
+            caminho = os.path.join(pasta, f'{nome}.csv')
+            pendentes.append((caminho_temporario(caminho), caminho))
+            tabela.to_csv(pendentes[-1][0], index=False, encoding='utf-8-sig')
+        caminho = os.path.join(pasta, ARQUIVO_MANIFESTO)
+        pendentes.append((caminho_temporario(caminho), caminho))
+        with open(pendentes[-1][0], 'w', encoding='utf-8') as arquivo:
+            json.dump(manifesto, arquivo, ensure_ascii=False, indent=2)
+        renomear_temporarios(pendentes)
+    finally:
+        descartar_temporarios(pendentes)
+    return manifesto
+
+def ler_manifesto(pasta):
+    """Manifesto do artefato da pasta, ou None se não houver artefato"""
+    try:
+        with open(os.path.join(pasta, ARQUIVO_MANIFESTO), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+def ler_artefato(pasta):
+    """Lê os dados gravados por salvar_artefato; retorna (DadosProcessados ou None, mensagem)"""
+    manifesto = ler_manifesto(pasta)
+    if manifesto is None:
+        return None, f"Nenhum dado pré-processado em '{pasta}'."
+    if manifesto.get('versao_pipeline') != VERSAO_PIPELINE:
+        return None, (f"Os dados pré-processados em '{pasta}' foram gerados por outra versão do processamento. "
+                      "Rode o processar_lote.py novamente.")
+    try:
+        dados = ler_dados_arrow(os.path.join(pasta, ARQUIVO_DADOS_ARTEFATO))
+    except Exception as e:
+        return None, f"❌ Erro ao ler os dados pré-processados: {str(e)}"
+    
+    gerado_em = datetime.fromisoformat(manifesto['gerado_em'])
+    dados.mensagem = dados.mensagem.rstrip() + f"""
+        - **Pré-processado em:** {gerado_em:%d/%m/%Y %H:%M} ({len(manifesto['arquivos'])} arquivo(s))
+        """
+    return dados, dados.mensagem
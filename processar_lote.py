@@ -0,0 +1,180 @@
+"""Processamento em lote das exportações de notas fiscais para o dashboard de Lead Time.
+
+Processa um ou mais CSVs com o mesmo pipeline do upload (notas fiscais repetidas entre arquivos são
+removidas) e grava na pasta de saída os dados processados em Arrow, os agregados em CSV
+(stats_gerais, stats_diarias, stats_canal) e um manifesto. Sem upload, o dashboard abre esses dados
+direto. Exemplos:
+
+    python processar_lote.py exportacoes/*.csv
+    python processar_lote.py notas_do_dia.csv --acrescentar      # só os arquivos ainda não processados
+    python processar_lote.py exportacoes/*.csv --saida /dados/leadtime --em-blocos --perfil
+    python processar_lote.py exportacoes/*.csv --trabalhadores 8   # blocos processados em 8 processos
+    python processar_lote.py exportacoes/*.csv --marcas "PAPAIZ,LA FONTE,SILVANA CD SP,YALE,VAULT"
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import processamento_leadtime as pl
+
+def ler_marcas(texto):
+    """Lista de marcas separadas por vírgula, ex.: 'PAPAIZ,YALE'"""
+    marcas = [marca.strip() for marca in texto.split(',') if marca.strip()]
+    if not marcas:
+        raise argparse.ArgumentTypeError("Informe ao menos uma marca")
+    return marcas
+
+def expandir_arquivos(padroes):
+    """Caminhos dos CSVs, expandindo curingas (o shell do Windows não expande); falha se algum não existir"""
+    arquivos = []
+    for padrao in padroes:
+        encontrados = sorted(glob.glob(padrao)) if glob.has_magic(padrao) else [padrao]
+        if not encontrados or not all(os.path.isfile(caminho) for caminho in encontrados):
+            raise FileNotFoundError(f"Arquivo não encontrado: {padrao}")
+        arquivos.extend(caminho for caminho in encontrados if caminho not in arquivos)
+    return arquivos
+
+def hash_caminho(caminho):
+    """SHA-256 do conteúdo do arquivo (identifica arquivos já processados no manifesto)"""
+    with open(caminho, 'rb') as arquivo:
+        return pl.calcular_hash_arquivo(arquivo)
+
+def processar(arquivos, base=None, em_blocos=False, motor_csv='c', saida=None, trabalhadores=pl.TRABALHADORES_PADRAO,
+              marcas=pl.MARCAS_PRINCIPAIS):
+    """Processa os arquivos acrescentando aos dados base (ou sozinhos); retorna (dados, descrição dos
+    arquivos processados, erros). Arquivos com erro ficam de fora e são listados em `erros`"""
+    # sys.stdout lido na chamada, não na importação (pode ter sido trocado depois, ex.: nos testes)
+    saida = saida or sys.stdout
+    carregar, opcoes = pl.opcoes_carga(em_blocos, motor_csv, trabalhadores, marcas)
+    # O índice de notas é copiado porque os dados base não podem mudar
+    indice = base.indice.copia() if base is not None else pl.IndiceNotasFiscais()
+    
+    partes = []
+    processados = []
+    erros = []
+    for caminho in arquivos:
+        with pl.etapa(os.path.basename(caminho)):
+            df, mensagem = carregar(caminho, indice=indice, **opcoes)
+        if pl.sem_notas_novas(df):
+            # Registrado no manifesto para não ser lido de novo, mas não é um erro
+            processados.append({'arquivo': os.path.basename(caminho), 'sha256': hash_caminho(caminho), 'registros': 0})
+            print(f"{caminho}: {mensagem}", file=saida)
+            continue
+        if df.empty:
+            erros.append(f"{caminho}: {mensagem.strip()}")
+            continue
+        partes.append(df)
+        processados.append({
+            'arquivo': os.path.basename(caminho),
+            'sha256': hash_caminho(caminho),
+            'registros': len(df)
+        })
+        print(f"{caminho}: {len(df):,} registros ({df.attrs['duplicados_removidos']:,} duplicados, "
+              f"{df.attrs['registros_filtrados']:,} de outras marcas, {df.attrs['datas_invalidas']:,} datas inválidas)",
+              file=saida)
+    if not partes:
+        # Sem registros novos, os dados base continuam os mesmos (None sem dados base)
+        return base, processados, erros
+    
+    with pl.etapa('Concatenação dos arquivos'):
+        df = pl.concatenar_blocos(partes, ignorar_indice=True)
+    pl.somar_contadores_carga(df, partes)
+    mensagem = pl.montar_mensagem_sucesso(
+        df,
+        f"{len(processados)} arquivo(s) em lote ({', '.join(item['arquivo'] for item in processados)})",
+        df.attrs['duplicados_removidos'],
+        df.attrs['registros_filtrados'],
+        f"{len(pl.COLUNAS_NECESSARIAS)} obrigatórias de cada arquivo"
+    )
+    try:
+        if base is not None:
+            return base.acrescentar(df, mensagem, indice), processados, erros
+        return pl.DadosProcessados(df, mensagem, indice), processados, erros
+    except Exception as e:
+        return None, processados, erros + [f"Erro ao processar os arquivos: {str(e)}"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Processa exportações de notas fiscais para o dashboard de Lead Time")
+    parser.add_argument('arquivos', nargs='+', help="CSVs a processar (aceita curingas, ex.: 'exportacoes/*.csv')")
+    parser.add_argument('--saida', default=pl.PASTA_ARTEFATO,
+                        help="Pasta dos dados processados (padrão: LEADTIME_ARTEFATO ou 'leadtime_processado')")
+    parser.add_argument('--acrescentar', action='store_true',
+                        help="Acrescenta aos dados já processados na pasta, ignorando arquivos já processados")
+    parser.add_argument('--em-blocos', action='store_true', help="Lê os arquivos em blocos (menos memória)")
+    parser.add_argument('--trabalhadores', type=int,
+                        help="Processos que processam os blocos em paralelo (implica --em-blocos; 0 = um por núcleo)")
+    parser.add_argument('--marcas', type=ler_marcas, default=pl.MARCAS_PRINCIPAIS,
+                        help="Marcas analisadas separadas por vírgula (padrão: LEADTIME_MARCAS ou as marcas principais)")
+    parser.add_argument('--motor-csv', choices=pl.motores_csv_disponiveis(), default='c', help="Leitor de CSV")
+    parser.add_argument('--perfil', action='store_true', help="Mostra o tempo e a memória de cada etapa")
+    argumentos = parser.parse_args(argv)
+    if argumentos.trabalhadores is not None:
+        argumentos.em_blocos = True
+        argumentos.trabalhadores = argumentos.trabalhadores or os.cpu_count() or 1
+    else:
+        argumentos.trabalhadores = pl.TRABALHADORES_PADRAO
+    
+    try:
+        arquivos = expandir_arquivos(argumentos.arquivos)
+    except FileNotFoundError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    
+    base = None
+    arquivos_base = []
+    if argumentos.acrescentar and pl.ler_manifesto(argumentos.saida) is not None:
+        base, mensagem = pl.ler_artefato(argumentos.saida)
+        if base is None:
+            print(f"❌ {mensagem}", file=sys.stderr)
+            return 1
+        manifesto_base = pl.ler_manifesto(argumentos.saida)
+        # Dados base de outras marcas não podem receber arquivos processados com este conjunto
+        if manifesto_base.get('marcas') != pl.chave_marcas(argumentos.marcas):
+            print(f"❌ Os dados em '{argumentos.saida}' foram processados para outras marcas "
+                  f"({manifesto_base.get('marcas', '?').replace('|', ', ')}); processe de novo sem --acrescentar.",
+                  file=sys.stderr)
+            return 1
+        arquivos_base = manifesto_base['arquivos']
+        ja_processados = {item['sha256'] for item in arquivos_base}
+        arquivos = [caminho for caminho in arquivos if hash_caminho(caminho) not in ja_processados]
+        if not arquivos:
+            print(f"Nenhum arquivo novo: os dados em '{argumentos.saida}' já estão atualizados.")
+            return 0
+    
+    # Processo próprio do comando: medir memória não atrapalha outras execuções
+    perfil = pl.PerfilEtapas(medir_memoria=True) if argumentos.perfil else None
+    token = pl.PERFIL_ATIVO.set(perfil)
+    inicio = time.perf_counter()
+    dados = None
+    try:
+        dados, processados, erros = processar(arquivos, base, argumentos.em_blocos, argumentos.motor_csv,
+                                              trabalhadores=argumentos.trabalhadores, marcas=argumentos.marcas)
+        if dados is not None:
+            with pl.etapa('Gravação dos dados processados'):
+                manifesto = pl.salvar_artefato(argumentos.saida, dados, arquivos_base + processados, argumentos.marcas)
+    except (OSError, ValueError) as e:
+        if dados is None:
+            raise
+        # A gravação é atômica: a pasta de saída continua com a geração anterior
+        print(f"❌ Erro ao gravar os dados em '{argumentos.saida}': {e}", file=sys.stderr)
+        return 1
+    finally:
+        pl.PERFIL_ATIVO.reset(token)
+        if perfil is not None:
+            perfil.encerrar()
+    
+    for erro in erros:
+        print(f"❌ {erro}", file=sys.stderr)
+    if dados is None:
+        return 1
+    print(f"✅ {manifesto['registros']:,} registros de {len(manifesto['arquivos'])} arquivo(s) gravados em "
+          f"'{argumentos.saida}' em {time.perf_counter() - inicio:.1f} s")
+    if perfil is not None:
+        print(perfil.tabela().to_string(index=False, float_format='{:,.2f}'.format))
+    # Arquivos com erro não impedem a gravação dos demais, mas o agendador deve ser avisado
+    return 1 if erros else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+"""Configuração dos testes: os módulos do projeto ficam na raiz do repositório."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import pytest
+
+import processamento_leadtime as lt
+
+@pytest.fixture
+def criar_csv(tmp_path):
+    """Função que grava um CSV de exportação com as colunas obrigatórias (e uma extra) e retorna o caminho"""
+    def criar(nome, marcas, canais, notas, data_emissao='10/03/2025', data_embarque='14/03/2025'):
+        caminho = tmp_path / nome
+        pd.DataFrame({
+            'desc_marca': marcas,
+            'desc_canal_venda': canais,
+            'dat_embarque': data_embarque,
+            'dat_emissao_nf': data_emissao,
+            'nom_cidade': 'SAO PAULO',
+            'num_nota_fiscal': notas,
+            'vlr_total': 100.0
+        }, columns=lt.COLUNAS_NECESSARIAS + ['vlr_total']).to_csv(caminho, index=False)
+        return str(caminho)
+    return criar
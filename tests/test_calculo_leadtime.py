@@ -0,0 +1,78 @@
+"""Lead time vetorizado comparado com o cálculo linha a linha original e, no calendário de cada local
+de expedição, com o np.busday_count."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import processamento_leadtime as lt
+
+def calcular_leadtime_excel(row):
+    """Cálculo linha a linha da versão original do dashboard (sem feriados)"""
+    data_emissao = row['Data_Emissao_NF']
+    data_embarque = row['Data_Embarque']
+    
+    if pd.isna(data_emissao) or pd.isna(data_embarque):
+        return 0
+    
+    if data_emissao.date() == data_embarque.date():
+        return 0
+    
+    dia_semana_emissao = data_emissao.weekday()
+    dec = 0 if dia_semana_emissao == 6 or dia_semana_emissao == 0 else 1
+    
+    try:
+        dias_uteis = np.busday_count(data_embarque.date(), data_emissao.date())
+        leadtime = dias_uteis - dec
+        return max(0, leadtime)
+    except:
+        return 0
+
+def pares_de_datas(semente, quantidade=20_000):
+    """Emissão e embarque aleatórios com hora do dia, datas vazias, mesmo dia e embarque antes da emissão"""
+    rng = np.random.default_rng(semente)
+    inicio = pd.Timestamp('2015-01-01')
+    emissao = inicio + pd.to_timedelta(rng.integers(0, 16 * 365, quantidade), unit='D') \
+        + pd.to_timedelta(rng.integers(0, 86_400, quantidade), unit='s')
+    embarque = emissao + pd.to_timedelta(rng.integers(-40, 60, quantidade), unit='D') \
+        + pd.to_timedelta(rng.integers(-86_400, 86_400, quantidade), unit='s')
+    
+    mesmo_dia = rng.random(quantidade) < 0.1
+    embarque = embarque.where(~mesmo_dia, emissao.normalize() + pd.to_timedelta(rng.integers(0, 86_400, quantidade), unit='s'))
+    df = pd.DataFrame({'Data_Emissao_NF': emissao, 'Data_Embarque': embarque})
+    df.loc[rng.random(quantidade) < 0.05, 'Data_Emissao_NF'] = pd.NaT
+    df.loc[rng.random(quantidade) < 0.05, 'Data_Embarque'] = pd.NaT
+    return df
+
+@pytest.mark.parametrize('semente', [0, 1, 2])
+def test_leadtime_igual_ao_calculo_linha_a_linha(semente):
+    df = pares_de_datas(semente)
+    esperado = df.apply(calcular_leadtime_excel, axis=1).to_numpy()
+    obtido = lt.calcular_leadtime_vetorizado(df['Data_Embarque'], df['Data_Emissao_NF'], lt.CalendarioDiasUteis())
+    assert (df['Data_Embarque'] < df['Data_Emissao_NF']).any() and (df['Data_Embarque'] > df['Data_Emissao_NF']).any()
+    np.testing.assert_array_equal(obtido, esperado)
+
+def test_leadtime_com_calendario_do_local_da_marca(monkeypatch):
+    # Um CD que trabalha aos sábados atende só a SILVANA CD SP; as outras marcas continuam no local padrão
+    monkeypatch.setitem(lt.CALENDARIOS_LOCAIS, 'CD SP', {
+        'mascara': '1111110', 'abrangencias': lt.ABRANGENCIAS_FERIADOS, 'emissao_sem_desconto': [0, 6]
+    })
+    monkeypatch.setitem(lt.LOCAL_MARCA, 'SILVANA CD SP', 'CD SP')
+    df = pares_de_datas(5)
+    marca = pd.Series(np.random.default_rng(6).choice(['PAPAIZ', 'LA FONTE', 'SILVANA CD SP'], len(df)))
+    
+    obtido = lt.calcular_leadtime_por_marca(marca, df['Data_Embarque'], df['Data_Emissao_NF'])
+    
+    silvana = (marca == 'SILVANA CD SP').to_numpy()
+    embarque = df['Data_Embarque'].to_numpy(dtype='datetime64[D]')[silvana]
+    emissao = df['Data_Emissao_NF'].to_numpy(dtype='datetime64[D]')[silvana]
+    validos = ~(np.isnat(embarque) | np.isnat(emissao)) & (embarque != emissao)
+    dias_uteis = np.busday_count(embarque[validos], emissao[validos], weekmask='1111110', holidays=lt.ler_feriados())
+    dec = ~pd.DatetimeIndex(emissao[validos]).weekday.isin([0, 6])
+    esperado = np.zeros(silvana.sum(), dtype=np.int64)
+    esperado[validos] = np.maximum(0, dias_uteis - dec)
+    np.testing.assert_array_equal(obtido[silvana], esperado)
+    
+    padrao = lt.calcular_leadtime_vetorizado(df['Data_Embarque'], df['Data_Emissao_NF'], lt.calendario_local())
+    np.testing.assert_array_equal(obtido[~silvana], padrao[~silvana])
+    # Os sábados contam só no CD SP
+    assert (obtido[silvana] > padrao[silvana]).any()
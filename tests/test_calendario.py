@@ -0,0 +1,18 @@
+"""Calendário de dias úteis (acumulados com feriados) comparado com o np.busday_count."""
+import numpy as np
+import pytest
+
+import processamento_leadtime as lt
+
+@pytest.mark.parametrize('mascara', ['1111100', '1111110', '0111110'])
+def test_contagem_igual_ao_busday_count(mascara):
+    rng = np.random.default_rng(3)
+    inicio = np.datetime64('2014-06-01') + rng.integers(0, 23 * 365, 50_000)
+    fim = inicio + rng.integers(-60, 60, 50_000)
+    # Datas fora da tabela de feriados e um intervalo longo ampliam a tabela de acumulados
+    inicio = np.concatenate([inicio, np.array(['1999-12-31', '2050-01-03'], dtype='datetime64[D]')])
+    fim = np.concatenate([fim, np.array(['2000-01-10', '2031-12-31'], dtype='datetime64[D]')])
+    
+    calendario = lt.CalendarioDiasUteis(lt.ler_feriados(), mascara)
+    esperado = np.busday_count(inicio, fim, weekmask=mascara, holidays=lt.ler_feriados())
+    np.testing.assert_array_equal(calendario.contar(inicio, fim), esperado)
@@ -0,0 +1,62 @@
+"""Carga do CSV (completa e em blocos) até a gravação em Arrow."""
+import warnings
+
+import pandas as pd
+import pytest
+
+import processamento_leadtime as lt
+
+@pytest.mark.parametrize('em_blocos', [False, True])
+def test_notas_mistas_lidas_como_texto(criar_csv, tmp_path, em_blocos):
+    # Só a última nota não é numérica, e '000007' repete a nota 7
+    notas = list(range(1, 3_001)) + ['000007', 'NF-ABC']
+    caminho = criar_csv('mistas.csv', 'PAPAIZ', 'WEBSHOP B2C', notas)
+    carregar, opcoes = lt.opcoes_carga(em_blocos, trabalhadores=1)
+    if em_blocos:
+        opcoes['tamanho_bloco'] = 1_000
+    
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', pd.errors.DtypeWarning)
+        df, mensagem = carregar(caminho, **opcoes)
+    
+    assert len(df) == 3_001, mensagem
+    assert df.attrs['duplicados_removidos'] == 1
+    assert df['num_nota_fiscal'].map(type).eq(str).all()
+    
+    pytest.importorskip('pyarrow')
+    dados = lt.DadosProcessados(df, mensagem, lt.IndiceNotasFiscais())
+    lt.gravar_dados_arrow(str(tmp_path / 'dados.arrow'), dados)
+    relidos = lt.ler_dados_arrow(str(tmp_path / 'dados.arrow'))
+    pd.testing.assert_frame_equal(relidos.df, df)
+
+@pytest.mark.parametrize('em_blocos', [False, True])
+def test_data_vazia_do_erp_nao_estoura_o_lead_time(criar_csv, em_blocos):
+    # 01/01/1900 é a "data vazia" de muitos ERPs: o lead time passa de 32.767 dias (limite do int16)
+    embarques = ['01/01/1900'] + ['14/03/2026'] * 99
+    caminho = criar_csv('erp.csv', 'PAPAIZ', 'WEBSHOP B2C', range(1, 101), data_emissao='10/03/2026', data_embarque=embarques)
+    esperado = lt.calcular_leadtime_vetorizado(pd.to_datetime(['1900-01-01']), pd.to_datetime(['2026-03-10']))[0]
+    assert esperado > 32_767
+    
+    dados, mensagem = lt.processar_arquivo(caminho, em_blocos=em_blocos)
+    assert dados is not None, mensagem
+    assert dados.df['LeadTime_Dias'].max() == esperado
+    assert dados.df['LeadTime_Dias'].min() == 0
+    assert dados.cubo.estatisticas_totais()['LeadTime_Max'] == esperado
+
+@pytest.mark.parametrize('em_blocos', [False, True])
+def test_arquivo_sem_notas_novas(criar_csv, em_blocos):
+    caminho = criar_csv('ontem.csv', 'PAPAIZ', 'WEBSHOP B2C', range(1, 101))
+    carregar, opcoes = lt.opcoes_carga(em_blocos, trabalhadores=1)
+    indice = lt.IndiceNotasFiscais()
+    df, _ = carregar(caminho, indice=indice, **opcoes)
+    assert len(df) == 100 and not lt.sem_notas_novas(df)
+    
+    # O mesmo arquivo de novo: vazio por não ter notas novas, não por serem de outras marcas
+    df, mensagem = carregar(caminho, indice=indice, **opcoes)
+    assert df.empty and lt.sem_notas_novas(df)
+    assert 'Nenhuma nota fiscal nova' in mensagem
+    
+    outras_marcas = criar_csv('outras.csv', 'OUTRA', 'WEBSHOP B2C', range(101, 111))
+    df, mensagem = carregar(outras_marcas, indice=indice, **opcoes)
+    assert df.empty and not lt.sem_notas_novas(df)
+    assert 'marcas analisadas' in mensagem
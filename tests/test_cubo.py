@@ -0,0 +1,47 @@
+"""Cubo de agregados de lead time comparado com as estatísticas calculadas direto nos registros."""
+import numpy as np
+import pandas as pd
+
+import processamento_leadtime as lt
+
+def registros_com_data_extrema(quantidade=5_000, semente=7):
+    """Registros com lead times pequenos e um único embarque digitado décadas antes da emissão"""
+    rng = np.random.default_rng(semente)
+    df = pd.DataFrame({
+        'Data': pd.Timestamp('2025-03-01') + pd.to_timedelta(rng.integers(0, 30, quantidade), unit='D'),
+        'Marca': pd.Categorical(rng.choice(['LA FONTE', 'PAPAIZ'], quantidade)),
+        'Canal_Agrupado': pd.Categorical(rng.choice(['WEBSHOP', 'HOME CENTER'], quantidade)),
+        'LeadTime_Dias': rng.poisson(4, quantidade).astype(np.int64)
+    })
+    # Embarque em 01/01/1950 com emissão em 2025: cerca de 19 mil dias úteis
+    df.loc[0, 'LeadTime_Dias'] = 19_409
+    return df
+
+def test_data_extrema_nao_aumenta_o_cubo(tmp_path):
+    df = registros_com_data_extrema()
+    cubo = lt.CuboLeadTime.de_dataframe(df)
+    normal = lt.CuboLeadTime.de_dataframe(df.iloc[1:])
+    
+    # Uma linha a mais só acrescenta uma tripla ao histograma
+    assert cubo.memoria_bytes < 2 * normal.memoria_bytes
+    assert cubo.estatisticas_totais()['LeadTime_Max'] == 19_409
+    
+    esperado = df.groupby('Marca', observed=True)['LeadTime_Dias'].quantile([0.25, 0.5, 0.9]).unstack()
+    pd.testing.assert_frame_equal(cubo.quantis([0.25, 0.5, 0.9], 'Marca'), esperado, check_names=False)
+    
+    caixas, atipicos = cubo.estatisticas_boxplot('Marca')
+    assert 19_409 in atipicos['LeadTime_Dias'].to_numpy()
+    
+    cubo.salvar(tmp_path / 'cubo.npz')
+    lido = lt.CuboLeadTime.carregar(tmp_path / 'cubo.npz')
+    pd.testing.assert_frame_equal(lido.quantis([0.25, 0.5, 0.9], 'Marca'), esperado, check_names=False)
+
+def test_combinar_e_filtrar_como_os_registros():
+    df = registros_com_data_extrema()
+    cubo = lt.CuboLeadTime.de_dataframe(df.iloc[:2_000]).combinar(lt.CuboLeadTime.de_dataframe(df.iloc[2_000:]))
+    filtrado = cubo.filtrar('2025-03-05', '2025-03-20', ['PAPAIZ', 'LA FONTE'], ['WEBSHOP'])
+    
+    selecionados = df[df['Data'].between('2025-03-05', '2025-03-20') & (df['Canal_Agrupado'] == 'WEBSHOP')]
+    esperado = selecionados.groupby('Marca', observed=True)['LeadTime_Dias'].quantile([0.1, 0.5, 0.95]).unstack()
+    pd.testing.assert_frame_equal(filtrado.quantis([0.1, 0.5, 0.95], 'Marca'), esperado, check_names=False)
+    assert filtrado.quantis([0.5])[0.5] == selecionados['LeadTime_Dias'].median()
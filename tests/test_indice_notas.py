@@ -0,0 +1,19 @@
+"""Índice de notas fiscais comparado com o drop_duplicates do pandas."""
+import numpy as np
+import pandas as pd
+
+import processamento_leadtime as lt
+
+def test_indice_igual_ao_drop_duplicates_entre_blocos():
+    rng = np.random.default_rng(4)
+    numericas = pd.Series(rng.integers(0, 5_000, 20_000))
+    textos = pd.Series(np.where(rng.random(20_000) < 0.02, None, 'NF-' + pd.Series(rng.integers(0, 5_000, 20_000)).astype(str)))
+    for notas in [numericas, textos]:
+        indice = lt.IndiceNotasFiscais()
+        novas = np.concatenate([indice.marcar_novas(notas.iloc[inicio:inicio + 3_000]) for inicio in range(0, len(notas), 3_000)])
+        np.testing.assert_array_equal(novas, ~notas.duplicated(keep='first').to_numpy())
+
+def test_indice_trata_zeros_a_esquerda_como_a_mesma_nota():
+    indice = lt.IndiceNotasFiscais()
+    assert indice.marcar_novas(pd.Series([123, 456])).tolist() == [True, True]
+    assert indice.marcar_novas(pd.Series(['000123', 'NF-ABC', '456', 'NF-ABC', '789'])).tolist() == [False, True, False, False, True]
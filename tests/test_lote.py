@@ -0,0 +1,74 @@
+"""Processamento em lote com acréscimo de arquivos (processar_lote.py)."""
+import os
+
+import pandas as pd
+import pytest
+
+import processamento_leadtime as lt
+import processar_lote
+
+pytest.importorskip('pyarrow')
+
+def test_acrescentar_arquivo_com_outras_marcas_e_canais(criar_csv, tmp_path, capsys):
+    primeiro = criar_csv('p1.csv', ['PAPAIZ', 'LA FONTE'] * 50, 'WEBSHOP B2C', range(1, 101))
+    segundo = criar_csv('p2.csv', 'SILVANA CD SP', 'HOME CENTER SP', range(101, 141), data_emissao='17/03/2025')
+    saida = str(tmp_path / 'saida')
+    
+    assert processar_lote.main([primeiro, '--saida', saida]) == 0
+    assert processar_lote.main([segundo, '--saida', saida, '--acrescentar']) == 0
+    
+    dados, mensagem = lt.ler_artefato(saida)
+    assert dados is not None, mensagem
+    assert len(dados.df) == 140
+    assert dados.cubo.marcas == ['LA FONTE', 'PAPAIZ', 'SILVANA CD SP']
+    assert dados.cubo.canais == ['HOME CENTER', 'WEBSHOP']
+    assert len(dados.indice) == 140
+    
+    # O cubo acumulado é igual ao cubo montado de uma vez com todos os registros
+    completo = lt.CuboLeadTime.de_dataframe(dados.df)
+    pd.testing.assert_frame_equal(
+        dados.cubo.estatisticas(['Marca', 'Canal_Agrupado']),
+        completo.estatisticas(['Marca', 'Canal_Agrupado'])
+    )
+    assert [item['arquivo'] for item in lt.ler_manifesto(saida)['arquivos']] == ['p1.csv', 'p2.csv']
+
+def test_falha_na_gravacao_mantem_os_dados_anteriores(criar_csv, tmp_path, monkeypatch, capsys):
+    primeiro = criar_csv('p1.csv', 'PAPAIZ', 'WEBSHOP B2C', range(1, 51))
+    segundo = criar_csv('p2.csv', 'PAPAIZ', 'WEBSHOP B2C', range(51, 81))
+    saida = str(tmp_path / 'saida')
+    assert processar_lote.main([primeiro, '--saida', saida]) == 0
+    
+    def falhar(self, arquivo):
+        raise OSError("disco cheio")
+    monkeypatch.setattr(lt.CuboLeadTime, 'salvar', falhar)
+    assert processar_lote.main([segundo, '--saida', saida, '--acrescentar']) == 1
+    assert 'disco cheio' in capsys.readouterr().err
+    assert not [nome for nome in os.listdir(saida) if nome.endswith('.tmp')]
+    
+    # Índice, dados e manifesto continuam os do primeiro arquivo: o acréscimo pode ser refeito
+    dados, _ = lt.ler_artefato(saida)
+    assert len(dados.df) == 50 and len(dados.indice) == 50
+    monkeypatch.undo()
+    assert processar_lote.main([segundo, '--saida', saida, '--acrescentar']) == 0
+    assert len(lt.ler_artefato(saida)[0].df) == 80
+
+def test_acrescentar_arquivo_sem_notas_novas(criar_csv, tmp_path, capsys):
+    primeiro = criar_csv('p1.csv', 'PAPAIZ', 'WEBSHOP B2C', range(1, 101))
+    # Exportação de ontem gerada de novo: outro conteúdo, mas só notas já processadas
+    repetido = criar_csv('p1_novamente.csv', 'PAPAIZ', 'WEBSHOP B2C', range(1, 51), data_embarque='15/03/2025')
+    saida = str(tmp_path / 'saida')
+    assert processar_lote.main([primeiro, '--saida', saida]) == 0
+    
+    assert processar_lote.main([repetido, '--saida', saida, '--acrescentar']) == 0
+    saidas = capsys.readouterr()
+    assert 'Nenhuma nota fiscal nova' in saidas.out
+    assert 'marcas analisadas' not in saidas.out + saidas.err
+    
+    dados, _ = lt.ler_artefato(saida)
+    assert len(dados.df) == 100
+    arquivos = lt.ler_manifesto(saida)['arquivos']
+    assert [(item['arquivo'], item['registros']) for item in arquivos] == [('p1.csv', 100), ('p1_novamente.csv', 0)]
+    
+    # Registrado no manifesto: não é lido de novo
+    assert processar_lote.main([repetido, '--saida', saida, '--acrescentar']) == 0
+    assert 'Nenhum arquivo novo' in capsys.readouterr().out
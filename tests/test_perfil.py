@@ -0,0 +1,35 @@
+"""Perfil de desempenho por etapa com o tracemalloc compartilhado pelo processo."""
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import processamento_leadtime as lt
+
+@pytest.fixture(autouse=True)
+def sem_tracemalloc():
+    if tracemalloc.is_tracing():
+        pytest.skip("tracemalloc já ligado fora dos perfis")
+    yield
+    assert not tracemalloc.is_tracing()
+
+def test_perfil_so_de_tempo_nao_liga_o_tracemalloc():
+    perfil = lt.PerfilEtapas()
+    with perfil.medir('Bloco'):
+        assert not tracemalloc.is_tracing()
+    perfil.encerrar()
+    assert list(perfil.tabela().columns) == ['Etapa', 'Tempo (ms)', 'Chamadas']
+
+def test_tracemalloc_fica_ligado_ate_o_ultimo_perfil_encerrar():
+    perfil_a = lt.PerfilEtapas(medir_memoria=True)
+    perfil_b = lt.PerfilEtapas(medir_memoria=True)
+    perfil_a.encerrar()
+    perfil_a.encerrar()
+    assert tracemalloc.is_tracing()
+    
+    with perfil_b.medir('Bloco de 20 MB'):
+        bloco = np.ones(20 * 1024 ** 2, dtype=np.uint8)
+    assert perfil_b.etapas['Bloco de 20 MB']['memoria_pico'] >= bloco.nbytes
+    
+    perfil_b.encerrar()
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,53 @@
+"""Registro de dados compartilhados entre sessões: referências, liberação pela coleta de lixo e descarte."""
+import gc
+
+import processamento_leadtime as lt
+
+class DadosFalsos:
+    """Dados com tamanho fixo; `ao_medir` roda na primeira leitura do tamanho (simula uma coleta de lixo ali)"""
+    
+    def __init__(self, tamanho, ao_medir=None):
+        self.tamanho = tamanho
+        self.ao_medir = ao_medir
+    
+    @property
+    def memoria_bytes(self):
+        if self.ao_medir is not None:
+            ao_medir, self.ao_medir = self.ao_medir, None
+            ao_medir()
+        return self.tamanho
+
+def test_referencia_protege_ate_ser_coletada():
+    registro = lt.RegistroDados(limite_bytes=150)
+    primeiro = DadosFalsos(100)
+    registro.guardar('a', primeiro)
+    referencia = registro.referenciar(primeiro)
+    registro.guardar('b', DadosFalsos(100))
+    assert len(registro) == 2 and registro.em_uso == 1
+    
+    # A liberação só é aplicada na próxima operação do registro, que descarta o excesso
+    del referencia
+    gc.collect()
+    assert registro.obter('b') is not None
+    assert registro.obter('a') is None
+    assert registro.em_uso == 0 and registro.descartes == 1
+
+def test_liberacao_durante_o_descarte_nao_altera_o_registro():
+    registro = lt.RegistroDados(limite_bytes=150)
+    sessoes = {}
+    
+    def coletar():
+        # Coleta de lixo no meio do descarte: libera as referências de 'a' e 'b'
+        sessoes.clear()
+        gc.collect()
+    
+    dados = {nome: DadosFalsos(100) for nome in 'ab'}
+    for nome, valor in dados.items():
+        registro.guardar(nome, valor)
+        sessoes[nome] = registro.referenciar(valor)
+    registro.guardar('c', DadosFalsos(100, ao_medir=coletar))
+    
+    # 'c' é protegido por ter acabado de ser guardado; 'a' e 'b' só saem na próxima operação
+    assert registro.obter('c') is not None
+    assert registro.obter('a') is None and registro.obter('b') is None
+    assert registro.em_uso == 0